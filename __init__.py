@@ -10,12 +10,30 @@ __version__ = "2.0.0"
 __author__ = "Chris Bunting"
 __email__ = "cbunting99@users.noreply.github.com"
 
-# Import main components for easier access
-from .mcp_server_enhanced import main
-from .memory_manager import MemoryManager
-from .database import DatabaseManager
-from .sequential_thinking import SequentialThinkingEngine, ThinkingStage
-from .project_conventions import ProjectConventionLearner
+import importlib
+
+# Main components are resolved lazily on first attribute access (PEP 562),
+# so importing the package does not pull in every submodule
+_LAZY_IMPORTS = {
+    'main': ('.mcp_server_enhanced', 'main'),
+    'MemoryManager': ('.memory_manager', 'MemoryManager'),
+    'DatabaseManager': ('.database', 'DatabaseManager'),
+    'SequentialThinkingEngine': ('.sequential_thinking', 'SequentialThinkingEngine'),
+    'ThinkingStage': ('.sequential_thinking', 'ThinkingStage'),
+    'ProjectConventionLearner': ('.project_conventions', 'ProjectConventionLearner'),
+}
+
+def __getattr__(name):
+    try:
+        module_name, attr = _LAZY_IMPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module_name, __name__), attr)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
 
 __all__ = [
     'main',
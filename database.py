@@ -708,11 +708,12 @@ class DatabaseManager:
             cursor: Cursor = self.connection.cursor()
             stats = {}
             
-            # Table counts
+            # Table counts in a single query
             tables = ('projects', 'memories', 'tasks', 'knowledge_relationships', 'sessions', 'notifications')
-            for table in tables:
-                cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
-                stats[f"{table}_count"] = cursor.fetchone()['count']
+            cursor.execute("SELECT " + ", ".join(
+                f"(SELECT COUNT(*) FROM {table}) as {table}_count" for table in tables
+            ))
+            stats.update(dict(cursor.fetchone()))
             
             # Database size
             cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
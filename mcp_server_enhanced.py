@@ -6,6 +6,7 @@ Automatically manages memories, knowledge graphs, and tasks with improved featur
 import os
 import json
 import logging
+import re
 import time
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
@@ -58,6 +59,13 @@ class ServerConfig:
 
 config = ServerConfig()
 
+# Task extraction patterns used by auto_process_conversation, compiled once
+_TASK_PATTERNS = [
+    re.compile(r'(?:TODO|FIXME|ACTION|TASK):\s*(.+)$', re.IGNORECASE | re.MULTILINE),
+    re.compile(r'(?:need to|should|must)\s+(.+)$', re.IGNORECASE | re.MULTILINE),
+    re.compile(r'(?:implement|create|build|add|fix)\s+(.+)$', re.IGNORECASE | re.MULTILINE),
+]
+
 # ==================== PERFORMANCE TRACKING ====================
 class PerformanceTracker:
     def __init__(self):
@@ -640,15 +648,8 @@ def auto_process_conversation(content: str, interaction_type: str = "conversatio
             })
         
         # Auto-extract tasks from content
-        task_patterns = [
-            r'(?:TODO|FIXME|ACTION|TASK):\s*(.+)$',
-            r'(?:need to|should|must)\s+(.+)$',
-            r'(?:implement|create|build|add|fix)\s+(.+)$',
-        ]
-        
-        import re
-        for pattern in task_patterns:
-            matches = re.findall(pattern, content, re.IGNORECASE | re.MULTILINE)
+        for pattern in _TASK_PATTERNS:
+            matches = pattern.findall(content)
             for match in matches[:3]:  # Limit to 3 auto-extracted tasks
                 if len(match.strip()) > 10:
                     try:
@@ -0,0 +1,4 @@
+-- Flag memories whose embedding is stored at unit L2 length
+-- Normalized embeddings let similarity search use a plain dot product
+
+ALTER TABLE memories ADD COLUMN embedding_normalized INTEGER DEFAULT 0;  -- 1 when embedding_vector has unit length
@@ -0,0 +1,18 @@
+-- Column-oriented storage for thinking-chain steps
+-- One row per step, written in batches and read back with a single ordered query
+
+CREATE TABLE IF NOT EXISTS chain_steps (
+    id TEXT PRIMARY KEY,
+    chain_id TEXT NOT NULL,
+    step_idx INTEGER NOT NULL,  -- Position of the step within its chain
+    stage TEXT NOT NULL,  -- Thinking stage name (analysis, planning, ...)
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    reasoning TEXT,
+    confidence REAL,
+    created_at REAL,  -- UNIX timestamp
+    embedding BLOB,  -- Little-endian float32 vector
+    FOREIGN KEY (chain_id) REFERENCES thinking_chains(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chain_steps_chain ON chain_steps(chain_id, step_idx);
@@ -0,0 +1,5 @@
+-- Store memory embeddings as symmetric int8 instead of a JSON float array
+-- The original vector is recovered as embedding_q8 / embedding_scale
+
+ALTER TABLE memories ADD COLUMN embedding_q8 BLOB;  -- int8 components, one byte per dimension
+ALTER TABLE memories ADD COLUMN embedding_scale REAL;  -- 127 / max(|v|) used when quantizing
@@ -15,6 +15,26 @@ from dataclasses import dataclass, asdict
 from enum import Enum
 import re
 
+# Extraction patterns are compiled once at import and reused for every line
+_KEY_POINT_PATTERNS = [
+    re.compile(r'^\s*[-*+]\s+(.+)$', re.MULTILINE | re.IGNORECASE),  # Bullet points
+    re.compile(r'^\s*\d+\.\s+(.+)$', re.MULTILINE | re.IGNORECASE),  # Numbered lists
+    re.compile(r'(?:Key|Important|Note|TODO|FIXME):\s*(.+)$', re.MULTILINE | re.IGNORECASE),  # Key phrases
+    re.compile(r'## (.+)$', re.MULTILINE | re.IGNORECASE),  # Headers
+]
+
+_DECISION_PATTERNS = [
+    re.compile(r'(?:decided|chosen|selected|agreed):\s*(.+)$', re.IGNORECASE),
+    re.compile(r'(?:decision|choice|conclusion):\s*(.+)$', re.IGNORECASE),
+    re.compile(r'(?:will|shall|must)\s+(.+)$', re.IGNORECASE),
+]
+
+_ACTION_PATTERNS = [
+    re.compile(r'(?:TODO|FIXME|ACTION|NEXT):\s*(.+)$', re.IGNORECASE),
+    re.compile(r'(?:need to|should|must)\s+(.+)$', re.IGNORECASE),
+    re.compile(r'(?:implement|create|build|add|fix)\s+(.+)$', re.IGNORECASE),
+]
+
 class ThinkingStage(Enum):
     """Stages of sequential thinking process"""
     ANALYSIS = "analysis"
@@ -358,17 +378,10 @@ class SequentialThinkingEngine:
         key_points = []
         
         # Look for bullet points, numbered lists, or key phrases
-        patterns = [
-            r'^\s*[-*+]\s+(.+)$',  # Bullet points
-            r'^\s*\d+\.\s+(.+)$',  # Numbered lists
-            r'(?:Key|Important|Note|TODO|FIXME):\s*(.+)$',  # Key phrases
-            r'## (.+)$',  # Headers
-        ]
-        
         lines = content.split('\n')
         for line in lines:
-            for pattern in patterns:
-                match = re.search(pattern, line, re.MULTILINE | re.IGNORECASE)
+            for pattern in _KEY_POINT_PATTERNS:
+                match = pattern.search(line)
                 if match:
                     point = match.group(1).strip()
                     if len(point) > 10 and point not in key_points:
@@ -381,16 +394,10 @@ class SequentialThinkingEngine:
         """Extract decisions made from content"""
         decisions = []
         
-        decision_patterns = [
-            r'(?:decided|chosen|selected|agreed):\s*(.+)$',
-            r'(?:decision|choice|conclusion):\s*(.+)$',
-            r'(?:will|shall|must)\s+(.+)$',
-        ]
-        
         lines = content.split('\n')
         for line in lines:
-            for pattern in decision_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
+            for pattern in _DECISION_PATTERNS:
+                match = pattern.search(line)
                 if match:
                     decision = match.group(1).strip()
                     if len(decision) > 10 and decision not in decisions:
@@ -402,16 +409,10 @@ class SequentialThinkingEngine:
         """Extract pending actions from content"""
         actions = []
         
-        action_patterns = [
-            r'(?:TODO|FIXME|ACTION|NEXT):\s*(.+)$',
-            r'(?:need to|should|must)\s+(.+)$',
-            r'(?:implement|create|build|add|fix)\s+(.+)$',
-        ]
-        
         lines = content.split('\n')
         for line in lines:
-            for pattern in action_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
+            for pattern in _ACTION_PATTERNS:
+                match = pattern.search(line)
                 if match:
                     action = match.group(1).strip()
                     if len(action) > 10 and action not in actions:
@@ -3,54 +3,96 @@ D1 Database Manager for Cloudflare Workers
 Adapted from SQLite implementation for D1
 """
 
-import json
-from datetime import datetime, timedelta
+import logging
+import secrets
+from datetime import datetime
 from typing import List, Dict, Optional, Any
 
+from .embeddings_cf import quantize_embedding
+from .ffi_cf import to_js
+from .json_cf import dumps_json
+
+logger = logging.getLogger(__name__)
+
+def _rows(result) -> List[Dict[str, Any]]:
+    """Convert the rows of a D1 all() result to Python dicts"""
+    if not result:
+        return []
+    rows = result.results
+    return rows.to_py() if hasattr(rows, 'to_py') else list(rows)
+
 class D1DatabaseManager:
     """Database manager adapted for Cloudflare D1"""
     
+    # D1 cannot bind table names, so only these tables may be counted
+    COUNTABLE_TABLES = ('memories', 'tasks', 'projects')
+    
     def __init__(self, d1_binding):
         """Initialize with D1 database binding"""
         self.db = d1_binding
         
+        # Prepared statements are reusable, so build the hot ones once
+        self._stmt_test = self.db.prepare("SELECT 1 as test")
+        self._stmt_stats = self.db.prepare(
+            "SELECT (SELECT COUNT(*) FROM memories) AS memories_count, "
+            "(SELECT COUNT(*) FROM tasks) AS tasks_count, "
+            "(SELECT COUNT(*) FROM projects) AS projects_count"
+        )
+        self._count_stmts = {
+            table: self.db.prepare(f"SELECT COUNT(*) as count FROM {table}")
+            for table in self.COUNTABLE_TABLES
+        }
+        
     async def test_connection(self) -> bool:
         """Test D1 database connection"""
         try:
-            result = await self.db.prepare("SELECT 1 as test").first()
+            result = await self._stmt_test.first()
             return result is not None
         except Exception as e:
-            console.error(f"D1 connection test failed: {e}")
+            logger.error(f"D1 connection test failed: {e}")
             return False
     
+    async def health_and_stats(self) -> Dict[str, Any]:
+        """Test the connection and count memories and tasks in one D1 round-trip"""
+        test, counts = await self.db.batch([self._stmt_test, self._stmt_stats])
+        row = counts.results[0] if counts.results else None
+        
+        return {
+            'connected': bool(test.results),
+            'memories_count': row['memories_count'] if row else 0,
+            'tasks_count': row['tasks_count'] if row else 0
+        }
+    
     async def get_database_stats(self) -> Dict[str, Any]:
         """Get comprehensive database statistics"""
         try:
-            # Get table counts
-            memories_count = await self._get_table_count('memories')
-            tasks_count = await self._get_table_count('tasks')
-            projects_count = await self._get_table_count('projects')
+            # Get all table counts in a single round-trip
+            result = await self._stmt_stats.first()
             
             stats = {
-                'memories_count': memories_count,
-                'tasks_count': tasks_count,
-                'projects_count': projects_count,
+                'memories_count': result['memories_count'] if result else 0,
+                'tasks_count': result['tasks_count'] if result else 0,
+                'projects_count': result['projects_count'] if result else 0,
                 'database_type': 'D1',
                 'generated_at': datetime.now().isoformat()
             }
             
             return stats
         except Exception as e:
-            console.error(f"Error getting database stats: {e}")
+            logger.error(f"Error getting database stats: {e}")
             return {'error': str(e)}
     
     async def _get_table_count(self, table_name: str) -> int:
         """Get count of rows in a table"""
+        stmt = self._count_stmts.get(table_name)
+        if stmt is None:
+            raise ValueError(f"Unknown table: {table_name}")
+        
         try:
-            result = await self.db.prepare(f"SELECT COUNT(*) as count FROM {table_name}").first()
+            result = await stmt.first()
             return result['count'] if result else 0
         except Exception as e:
-            console.error(f"Error counting {table_name}: {e}")
+            logger.error(f"Error counting {table_name}: {e}")
             return 0
     
     async def initialize_schema(self):
@@ -58,17 +100,169 @@ class D1DatabaseManager:
         # This will be implemented when we create proper D1 migrations
         pass
     
-    # Placeholder methods for other database operations
-    async def add_memory(self, **kwargs) -> str:
-        """Add a memory to the database"""
-        # TODO: Implement D1-specific memory insertion
-        return "mem_" + str(int(datetime.now().timestamp()))
-    
-    async def get_memories(self, **kwargs) -> List[Dict[str, Any]]:
-        """Get memories from the database"""
-        # TODO: Implement D1-specific memory retrieval
-        return []
+    async def ensure_project(self, project_id: str, name: str, description: Optional[str] = None):
+        """Insert a project row unless it already exists
+        
+        memories, tasks and thinking_chains reference projects(id), so the
+        project must exist before anything is stored under it.
+        """
+        await self.db.prepare("""
+            INSERT OR IGNORE INTO projects (id, name, description) VALUES (?, ?, ?)
+        """).bind(project_id, name, description).run()
+    
+    async def add_memory(self, **memory) -> str:
+        """Insert one memory; takes the same fields as an add_memories item"""
+        memory_ids = await self.add_memories([memory])
+        return memory_ids[0]
+    
+    async def add_memories(self, memories: List[Dict[str, Any]]) -> List[str]:
+        """Insert several memories in one D1 batch round-trip
+        
+        Each item needs project_id, memory_type, title and content, and may
+        carry embedding, embedding_normalized, importance_score, tags and metadata.
+        Embeddings are stored int8-quantized (BLOB plus scale) rather than as JSON.
+        """
+        if not memories:
+            return []
+        
+        stmt = self.db.prepare("""
+            INSERT INTO memories (id, project_id, type, title, content, embedding_q8, embedding_scale,
+                                  embedding_normalized, importance_score, tags, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """)
+        
+        memory_ids = []
+        statements = []
+        for memory in memories:
+            memory_id = secrets.token_hex(16)
+            embedding = memory.get('embedding')
+            q8, scale = quantize_embedding(embedding) if embedding else (None, None)
+            memory_ids.append(memory_id)
+            statements.append(stmt.bind(
+                memory_id,
+                memory['project_id'],
+                memory['memory_type'],
+                memory['title'],
+                memory['content'],
+                to_js(q8) if q8 is not None else None,
+                scale,
+                1 if memory.get('embedding_normalized') else 0,
+                memory.get('importance_score', 0.5),
+                dumps_json(memory.get('tags') or []),
+                dumps_json(memory.get('metadata') or {})
+            ))
+        
+        await self.db.batch(statements)
+        return memory_ids
     
+    async def update_embeddings(self, memory_ids: List[str], embeddings: List[Optional[List[float]]]) -> int:
+        """Patch embeddings onto existing memories in one D1 batch round-trip
+        
+        Rows whose embedding is None are left unchanged.
+        """
+        stmt = self.db.prepare("""
+            UPDATE memories SET embedding_q8 = ?, embedding_scale = ?, embedding_normalized = 1
+            WHERE id = ?
+        """)
+        statements = []
+        for memory_id, embedding in zip(memory_ids, embeddings):
+            if embedding:
+                q8, scale = quantize_embedding(embedding)
+                statements.append(stmt.bind(to_js(q8), scale, memory_id))
+        
+        if statements:
+            await self.db.batch(statements)
+        return len(statements)
+    
+    async def add_thinking_chain(self, chain_id: str, project_id: Optional[str], objective: str,
+                                 metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Insert the thinking_chains row that chain_steps rows reference"""
+        await self.db.prepare("""
+            INSERT INTO thinking_chains (id, project_id, objective, metadata)
+            VALUES (?, ?, ?, ?)
+        """).bind(chain_id, project_id, objective, dumps_json(metadata or {})).run()
+        return chain_id
+    
+    async def add_chain_steps(self, steps: Dict[str, List[Any]]) -> int:
+        """Insert buffered thinking steps in one D1 batch round-trip
+        
+        steps maps column names (id, chain_id, step_idx, stage, title, content,
+        reasoning, confidence, created_at, embedding) to equal-length lists.
+        D1 caps bound parameters per statement, so rows are bound individually
+        and sent together with db.batch().
+        """
+        if not steps['id']:
+            return 0
+        
+        stmt = self.db.prepare("""
+            INSERT INTO chain_steps (id, chain_id, step_idx, stage, title, content,
+                                     reasoning, confidence, created_at, embedding)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """)
+        statements = [
+            stmt.bind(*row[:-1], to_js(row[-1]) if row[-1] is not None else None)
+            for row in zip(
+                steps['id'], steps['chain_id'], steps['step_idx'], steps['stage'],
+                steps['title'], steps['content'], steps['reasoning'],
+                steps['confidence'], steps['created_at'], steps['embedding']
+            )
+        ]
+        
+        await self.db.batch(statements)
+        return len(statements)
+    
+    async def get_next_step_idx(self, chain_id: str) -> int:
+        """Return the step index that follows the last stored step of a chain"""
+        result = await self.db.prepare(
+            "SELECT COALESCE(MAX(step_idx) + 1, 0) AS next_idx FROM chain_steps WHERE chain_id = ?"
+        ).bind(chain_id).first()
+        return result['next_idx'] if result else 0
+    
+    async def get_chain_steps(self, chain_id: str) -> List[Dict[str, Any]]:
+        """Get all steps of a thinking chain in order with a single query"""
+        result = await self.db.prepare("""
+            SELECT id, step_idx, stage, title, content, reasoning, confidence, created_at
+            FROM chain_steps WHERE chain_id = ? ORDER BY step_idx, created_at
+        """).bind(chain_id).all()
+        return _rows(result)
+    
+    async def get_memories(self, project_id: Optional[str] = None, memory_ids: Optional[List[str]] = None,
+                           limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get memories, optionally restricted to a project and a set of ids
+        
+        Rows are ordered by importance, then newest first.
+        """
+        conditions = []
+        params: List[Any] = []
+        if project_id is not None:
+            conditions.append("project_id = ?")
+            params.append(project_id)
+        if memory_ids is not None:
+            if not memory_ids:
+                return []
+            conditions.append(f"id IN ({', '.join('?' * len(memory_ids))})")
+            params.extend(memory_ids)
+        
+        query = """
+            SELECT id, project_id, type, title, content, embedding_q8, embedding_scale,
+                   embedding_normalized, importance_score, tags, metadata, created_at
+            FROM memories
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY importance_score DESC, created_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        try:
+            result = await self.db.prepare(query).bind(*params).all()
+            return _rows(result)
+        except Exception as e:
+            logger.error(f"Error getting memories: {e}")
+            return []
+    
+    # Placeholder methods for other database operations
     async def add_task(self, **kwargs) -> str:
         """Add a task to the database"""  
         # TODO: Implement D1-specific task insertion
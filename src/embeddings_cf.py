@@ -3,85 +3,516 @@ Cloudflare Workers AI Embeddings
 Replaces sentence-transformers with Cloudflare AI
 """
 
+import asyncio
+import base64
+import hashlib
+import heapq
+import importlib.util
 import json
-from typing import List, Dict, Any, Optional
+import logging
+import math
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
+# numba is slow to import, so only check that it is installed; the kernel is
+# compiled on first use by _get_int8_kernel when SimSIMD is not available
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+
+INT8_SCALE = 127.0
+
+_int8_kernel = None
+
+def _get_int8_kernel():
+    """Return the compiled int8 dot-product kernel, or None if numba is unusable"""
+    global _int8_kernel, NUMBA_AVAILABLE
+    if _int8_kernel is None and NUMBA_AVAILABLE:
+        try:
+            import numba
+        except ImportError as e:
+            logger.error(f"numba unavailable: {e}")
+            NUMBA_AVAILABLE = False
+            return None
+        
+        @numba.njit(parallel=True, fastmath=True)
+        def _int8_dot_scores(matrix, probe):
+            """Dot every int8 row with an int8 probe, accumulating in int32"""
+            scores = np.empty(matrix.shape[0], dtype=np.int32)
+            for i in numba.prange(matrix.shape[0]):
+                acc = 0
+                for j in range(matrix.shape[1]):
+                    acc += np.int32(matrix[i, j]) * np.int32(probe[j])
+                scores[i] = acc
+            return scores
+        
+        _int8_kernel = _int8_dot_scores
+    return _int8_kernel
+
+def normalize_embedding(embedding: List[float]) -> List[float]:
+    """Scale an embedding to unit L2 length so cosine similarity is a dot product"""
+    if NUMPY_AVAILABLE:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) + 1e-12
+        return vector.tolist()
+    
+    magnitude = sum(x * x for x in embedding) ** 0.5 + 1e-12
+    return [x / magnitude for x in embedding]
+
+def encode_embedding(embedding: List[float]) -> bytes:
+    """Pack an embedding as little-endian float32 bytes for KV/R2 storage
+    
+    A 1024-dim vector is 4KB packed versus roughly 15-20KB as a JSON array.
+    """
+    if NUMPY_AVAILABLE:
+        return np.asarray(embedding, dtype='<f4').tobytes()
+    
+    packed = array('f', embedding)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+def decode_embedding(blob: bytes) -> List[float]:
+    """Unpack an embedding stored by encode_embedding"""
+    if NUMPY_AVAILABLE:
+        return np.frombuffer(blob, dtype='<f4').tolist()
+    
+    packed = array('f')
+    packed.frombytes(blob)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tolist()
+
+def quantize_embedding(embedding: List[float]) -> Tuple[bytes, float]:
+    """Quantize an embedding to symmetric int8 for D1 storage
+    
+    Returns the packed int8 bytes and the per-vector scale (127 / max |v|);
+    the original is recovered as q / scale. A quarter of the float32 size.
+    """
+    if NUMPY_AVAILABLE:
+        vector = np.asarray(embedding, dtype=np.float32)
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = INT8_SCALE / peak if peak > 0 else 1.0
+        return np.round(vector * scale).astype(np.int8).tobytes(), scale
+    
+    peak = max((abs(x) for x in embedding), default=0.0)
+    scale = INT8_SCALE / peak if peak > 0 else 1.0
+    return array('b', [round(x * scale) for x in embedding]).tobytes(), scale
+
+def dequantize_embedding(blob: bytes, scale: float) -> List[float]:
+    """Recover a float embedding stored by quantize_embedding"""
+    if NUMPY_AVAILABLE:
+        return (np.frombuffer(bytes(blob), dtype=np.int8).astype(np.float32) / scale).tolist()
+    
+    return [q / scale for q in array('b', bytes(blob))]
+
+class EmbeddingIndex:
+    """Contiguous matrix of unit-normalized embeddings plus item metadata
+    
+    Vectors are stored as int8 by default, a quarter of the float32 footprint,
+    each row with its own scale (127 / max |v|). Rows quantized by
+    quantize_embedding are copied in as-is. Set quantize=False to keep
+    float32 for validation.
+    """
+    
+    def __init__(self, capacity: int = 64, quantize: bool = True):
+        """Initialize an empty index; storage is allocated on first add"""
+        self.capacity = capacity
+        self.quantize = quantize
+        self.dtype = np.int8 if quantize else np.float32
+        self.matrix = None
+        self.scales = None
+        self.meta: List[Dict[str, Any]] = []
+    
+    def __len__(self) -> int:
+        return len(self.meta)
+    
+    def add(self, item: Dict[str, Any]) -> bool:
+        """Add an item with an 'embedding' or 'embedding_q8' key; items without one are skipped
+        
+        Items flagged with 'embedding_normalized' are trusted to be unit length.
+        """
+        q8 = item.get('embedding_q8')
+        if q8:
+            if self.quantize:
+                vector = np.frombuffer(bytes(q8), dtype=np.int8)
+                # Unit-normalizing q / scale is the same as dividing q by its own norm
+                scale = item['embedding_scale'] if item.get('embedding_normalized') else (np.linalg.norm(vector) or 1.0)
+            else:
+                vector = np.frombuffer(bytes(q8), dtype=np.int8).astype(np.float32) / item['embedding_scale']
+        else:
+            embedding = item.get('embedding')
+            if not embedding:
+                return False
+            vector = np.asarray(embedding, dtype=np.float32)
+        
+        if self.matrix is None:
+            self.matrix = np.empty((self.capacity, vector.shape[0]), dtype=self.dtype)
+            self.scales = np.ones(self.capacity, dtype=np.float32)
+        elif len(self.meta) == self.matrix.shape[0]:
+            # Double storage on growth to keep appends amortized O(1)
+            grown = np.empty((self.matrix.shape[0] * 2, self.matrix.shape[1]), dtype=self.dtype)
+            grown[:len(self.meta)] = self.matrix
+            self.matrix = grown
+            self.scales = np.concatenate([self.scales, np.ones_like(self.scales)])
+        
+        if not (q8 and self.quantize):
+            if not item.get('embedding_normalized'):
+                norm = np.linalg.norm(vector)
+                if norm > 0:
+                    vector = vector / norm
+            if self.quantize:
+                peak = np.abs(vector).max()
+                scale = INT8_SCALE / peak if peak > 0 else 1.0
+                vector = np.round(vector * scale)
+        if self.quantize:
+            self.scales[len(self.meta)] = scale
+        self.matrix[len(self.meta)] = vector
+        self.meta.append(item)
+        return True
+    
+    def to_bytes(self) -> bytes:
+        """Pack int8 rows, per-row scales and item ids into one blob for R2
+        
+        Layout: little-endian uint32 (rows, dims, id bytes), float32 scales,
+        int8 matrix, then the ids as a JSON array.
+        """
+        if not self.quantize:
+            raise ValueError("Only quantized indexes can be packed")
+        
+        count = len(self.meta)
+        dims = self.matrix.shape[1] if self.matrix is not None else 0
+        ids = json.dumps([item['id'] for item in self.meta]).encode('utf-8')
+        parts = [struct.pack('<III', count, dims, len(ids))]
+        if count:
+            parts.append(self.scales[:count].astype('<f4').tobytes())
+            parts.append(self.matrix[:count].tobytes())
+        parts.append(ids)
+        return b''.join(parts)
+    
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'EmbeddingIndex':
+        """Rebuild an index packed by to_bytes; items carry only their 'id'"""
+        count, dims, ids_length = struct.unpack_from('<III', blob)
+        offset = 12
+        index = cls(capacity=max(count, 1))
+        if count:
+            index.scales = np.frombuffer(blob, dtype='<f4', count=count, offset=offset).astype(np.float32)
+            offset += 4 * count
+            index.matrix = np.frombuffer(blob, dtype=np.int8, count=count * dims, offset=offset).reshape(count, dims).copy()
+            offset += count * dims
+        index.meta = [{'id': item_id} for item_id in json.loads(blob[offset:offset + ids_length])]
+        return index
+    
+    def query(self, query_embedding: List[float], threshold: float = 0.7, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return up to top_k items with cosine similarity >= threshold, highest first"""
+        if not self.meta:
+            return []
+        
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        
+        query = query / query_norm
+        matrix = self.matrix[:len(self.meta)]
+        if SIMSIMD_AVAILABLE:
+            # SimSIMD dispatches to AVX2/AVX-512/NEON kernels, including int8 dot products
+            if self.quantize:
+                probe = np.round(query * INT8_SCALE).astype(np.int8)
+                scores = np.asarray(simsimd.cdist(probe[None, :], matrix, metric='dot'), dtype=np.float32)[0]
+                scores /= INT8_SCALE * self.scales[:len(self.meta)]
+            else:
+                scores = np.asarray(simsimd.cdist(query[None, :], matrix, metric='dot'), dtype=np.float32)[0]
+        elif self.quantize and NUMBA_AVAILABLE and _get_int8_kernel() is not None:
+            # Compiled int8 kernel avoids widening the whole matrix per query
+            probe = np.round(query * INT8_SCALE).astype(np.int8)
+            scores = _int8_kernel(matrix, probe).astype(np.float32)
+            scores /= INT8_SCALE * self.scales[:len(self.meta)]
+        elif self.quantize:
+            # NumPy has no int8 BLAS kernel, so widen to float32 for the SGEMV
+            scores = (matrix.astype(np.float32) @ query) / self.scales[:len(self.meta)]
+        else:
+            scores = matrix @ query
+        matches = np.where(scores >= threshold)[0]
+        if top_k is not None and top_k < len(matches):
+            # Partial sort: only the top_k candidates need ordering
+            matches = matches[np.argpartition(-scores[matches], top_k)[:top_k]]
+        matches = matches[np.argsort(-scores[matches], kind='stable')]
+        
+        return [{**self.meta[i], 'similarity': float(scores[i])} for i in matches]
 
 class CloudflareEmbeddings:
     """Embeddings using Cloudflare Workers AI"""
     
-    def __init__(self, ai_binding):
+    def __init__(self, ai_binding, max_concurrency: int = 8):
         """Initialize with Workers AI binding"""
         self.ai = ai_binding
         self.model_name = "@cf/baai/bge-large-en-v1.5"  # Maximum quality embeddings
+        self.max_concurrency = max_concurrency  # Cap in-flight Workers AI requests
+        self.batch_size = 96  # Texts per Workers AI call (model accepts up to 100)
+        self.quantize = True  # Store int8 vectors in similarity indexes
+        
+        # Recent text -> embedding results, and requests currently in flight
+        self.cache_size = 512
+        self._cache: 'OrderedDict[bytes, List[float]]' = OrderedDict()
+        self._inflight: Dict[bytes, 'asyncio.Future'] = {}
         
     async def generate_embedding(self, text: str) -> Optional[List[float]]:
-        """Generate embedding for a single text"""
+        """Generate embedding for a single text
+        
+        Recently embedded texts are served from an LRU cache, and concurrent
+        requests for the same text share a single Workers AI call.
+        """
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+        
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._request_embedding(text))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda done: self._finish_embedding(key, done))
+        
+        # Shielded so a cancelled caller does not cancel the call other waiters share
+        return await asyncio.shield(pending)
+    
+    def _finish_embedding(self, key: bytes, done: 'asyncio.Future'):
+        """Retire a finished in-flight request and cache its embedding"""
+        del self._inflight[key]
+        if done.cancelled() or done.exception() is not None:
+            return
+        embedding = done.result()
+        if embedding is not None:
+            self._cache[key] = embedding
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
+    async def _request_embedding(self, text: str) -> Optional[List[float]]:
+        """Call Workers AI to embed a single text"""
         try:
             # Use Cloudflare Workers AI to generate embedding
             result = await self.ai.run(self.model_name, {
                 'text': text
             })
             
-            # Extract embedding from result
+            # Extract embedding from result, normalized once here so
+            # similarity scoring never recomputes magnitudes
             if 'data' in result and len(result['data']) > 0:
-                return result['data'][0]
+                return normalize_embedding(result['data'][0])
             else:
-                console.error(f"No embedding data in result: {result}")
+                logger.error(f"No embedding data in result: {result}")
                 return None
                 
         except Exception as e:
-            console.error(f"Error generating embedding: {e}")
+            logger.error(f"Error generating embedding: {e}")
             return None
     
+    async def _generate_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Generate embeddings for one batch of texts in a single Workers AI call"""
+        try:
+            result = await self.ai.run(self.model_name, {
+                'text': texts
+            })
+            
+            data = result['data'] if 'data' in result else []
+            if len(data) != len(texts):
+                logger.error(f"Expected {len(texts)} embeddings, got {len(data)}")
+                return [None] * len(texts)
+            return [normalize_embedding(embedding) for embedding in data]
+            
+        except Exception as e:
+            logger.error(f"Error generating embedding batch: {e}")
+            return [None] * len(texts)
+    
     async def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
-        """Generate embeddings for multiple texts"""
-        embeddings = []
-        for text in texts:
-            embedding = await self.generate_embedding(text)
-            embeddings.append(embedding)
-        return embeddings
+        """Generate embeddings for multiple texts
+        
+        Texts are sent in batches of batch_size per Workers AI call, with up to
+        max_concurrency batches in flight at once.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def _generate_shard(shard: List[str]) -> List[Optional[List[float]]]:
+            async with semaphore:
+                return await self._generate_batch(shard)
+        
+        shards = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*[_generate_shard(shard) for shard in shards])
+        return [embedding for shard_result in results for embedding in shard_result]
     
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Calculate cosine similarity between two vectors"""
+        """Calculate cosine similarity between two unit-length vectors
+        
+        Embeddings from generate_embedding are already normalized, so this is
+        a plain dot product; pass other vectors through normalize_embedding first.
+        """
         try:
-            # Dot product
-            dot_product = sum(a * b for a, b in zip(vec1, vec2))
+            if NUMPY_AVAILABLE:
+                return float(np.dot(np.asarray(vec1, dtype=np.float32), np.asarray(vec2, dtype=np.float32)))
             
-            # Magnitudes
-            magnitude1 = sum(a * a for a in vec1) ** 0.5
-            magnitude2 = sum(b * b for b in vec2) ** 0.5
-            
-            if magnitude1 == 0 or magnitude2 == 0:
-                return 0.0
-            
-            return dot_product / (magnitude1 * magnitude2)
+            return sum(a * b for a, b in zip(vec1, vec2))
         except Exception as e:
-            console.error(f"Error calculating cosine similarity: {e}")
+            logger.error(f"Error calculating cosine similarity: {e}")
             return 0.0
     
-    async def find_similar_texts(self, query_text: str, text_embeddings: List[Dict[str, Any]], threshold: float = 0.7) -> List[Dict[str, Any]]:
-        """Find texts similar to query text"""
+    def build_index(self, text_embeddings: List[Dict[str, Any]]) -> 'EmbeddingIndex':
+        """Build a reusable similarity index from items with an 'embedding' key"""
+        index = EmbeddingIndex(quantize=self.quantize)
+        for item in text_embeddings:
+            index.add(item)
+        return index
+    
+    async def find_similar_texts(self, query_text: str, text_embeddings: Union[List[Dict[str, Any]], 'EmbeddingIndex'], threshold: float = 0.7, top_k: Optional[int] = 20) -> List[Dict[str, Any]]:
+        """Find the top_k texts most similar to query text (top_k=None returns all matches)
+        
+        Pass an EmbeddingIndex to reuse the candidate matrix across queries.
+        """
         try:
             # Generate embedding for query
             query_embedding = await self.generate_embedding(query_text)
             if not query_embedding:
                 return []
             
-            # Calculate similarities
-            similarities = []
-            for item in text_embeddings:
-                if 'embedding' in item and item['embedding']:
-                    similarity = self.cosine_similarity(query_embedding, item['embedding'])
-                    if similarity >= threshold:
-                        similarities.append({
-                            **item,
-                            'similarity': similarity
-                        })
-            
-            # Sort by similarity (highest first)
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            return similarities
+            return self.rank_by_similarity(query_embedding, text_embeddings, threshold, top_k)
             
         except Exception as e:
-            console.error(f"Error finding similar texts: {e}")
-            return []
\ No newline at end of file
+            logger.error(f"Error finding similar texts: {e}")
+            return []
+    
+    def rank_by_similarity(self, query_embedding: List[float], text_embeddings: Union[List[Dict[str, Any]], 'EmbeddingIndex'], threshold: float = 0.7, top_k: Optional[int] = 20) -> List[Dict[str, Any]]:
+        """Rank items against an already computed query embedding"""
+        if NUMPY_AVAILABLE:
+            if not isinstance(text_embeddings, EmbeddingIndex):
+                text_embeddings = self.build_index(text_embeddings)
+            return text_embeddings.query(query_embedding, threshold, top_k)
+        
+        # Normalize like EmbeddingIndex.add so the dot product is a cosine
+        query_norm = math.sqrt(sum(x * x for x in query_embedding))
+        if query_norm == 0:
+            return []
+        query_embedding = [x / query_norm for x in query_embedding]
+        
+        # Calculate similarities
+        similarities = []
+        for item in text_embeddings:
+            embedding = item.get('embedding')
+            if not embedding and item.get('embedding_q8'):
+                embedding = dequantize_embedding(item['embedding_q8'], item['embedding_scale'])
+            if embedding and not item.get('embedding_normalized'):
+                norm = math.sqrt(sum(x * x for x in embedding))
+                embedding = [x / norm for x in embedding] if norm > 0 else None
+            if embedding:
+                similarity = self.cosine_similarity(query_embedding, embedding)
+                if similarity >= threshold:
+                    similarities.append({
+                        **item,
+                        'similarity': similarity
+                    })
+        
+        # Sort by similarity (highest first)
+        if top_k is not None:
+            return heapq.nlargest(top_k, similarities, key=lambda x: x['similarity'])
+        similarities.sort(key=lambda x: x['similarity'], reverse=True)
+        return similarities
+
+class EmbeddingCache:
+    """KV-backed read-through cache in front of CloudflareEmbeddings
+    
+    Entries are keyed by the SHA-256 of the text with whitespace collapsed and
+    case folded (the BGE tokenizer is uncased), so trivially different inputs
+    share one embedding. Values are base64 float32 blobs with a KV TTL.
+    """
+    
+    def __init__(self, embeddings: CloudflareEmbeddings, kv_cache, ttl_seconds: int = 300, wait_until=None):
+        """Wrap an embeddings client with a KV namespace
+        
+        wait_until is the runtime's ctx.waitUntil; when given, cache writes run
+        in the background instead of delaying the caller.
+        """
+        self.embeddings = embeddings
+        self.kv = kv_cache
+        self.ttl_seconds = ttl_seconds
+        self.wait_until = wait_until
+    
+    def __getattr__(self, name):
+        # Everything other than generation is served by the wrapped client
+        return getattr(self.embeddings, name)
+    
+    def _cache_key(self, text: str) -> str:
+        normalized = ' '.join(text.split()).casefold()
+        digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        return f"emb:{self.embeddings.model_name}:{digest}"
+    
+    async def _get_cached(self, key: str) -> Optional[List[float]]:
+        try:
+            blob = await self.kv.get(key)
+            if blob:
+                return decode_embedding(base64.b64decode(blob))
+        except Exception as e:
+            logger.error(f"Error reading embedding cache: {e}")
+        return None
+    
+    async def _put_cached(self, key: str, embedding: List[float]):
+        try:
+            blob = base64.b64encode(encode_embedding(embedding)).decode('ascii')
+            await self.kv.put(key, blob, {'expirationTtl': self.ttl_seconds})
+        except Exception as e:
+            logger.error(f"Error writing embedding cache: {e}")
+    
+    async def _store(self, writes: List[Tuple[str, List[float]]]):
+        """Write new embeddings to KV, in the background when possible"""
+        if not writes:
+            return
+        stored = asyncio.gather(*[self._put_cached(key, embedding) for key, embedding in writes])
+        if self.wait_until is not None:
+            self.wait_until(stored)
+        else:
+            await stored
+    
+    async def generate_embedding(self, text: str) -> Optional[List[float]]:
+        """Generate embedding for a single text, using KV when possible"""
+        key = self._cache_key(text)
+        embedding = await self._get_cached(key)
+        if embedding is not None:
+            return embedding
+        
+        embedding = await self.embeddings.generate_embedding(text)
+        if embedding is not None:
+            await self._store([(key, embedding)])
+        return embedding
+    
+    async def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Generate embeddings for multiple texts, batching only the KV misses"""
+        keys = [self._cache_key(text) for text in texts]
+        embeddings = list(await asyncio.gather(*[self._get_cached(key) for key in keys]))
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            generated = await self.embeddings.generate_embeddings([texts[i] for i in missing])
+            writes = []
+            for i, embedding in zip(missing, generated):
+                embeddings[i] = embedding
+                if embedding is not None:
+                    writes.append((keys[i], embedding))
+            await self._store(writes)
+        
+        return embeddings
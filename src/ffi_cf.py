@@ -0,0 +1,17 @@
+"""
+Pyodide FFI helpers for Cloudflare Workers
+Converts Python values for JS bindings; outside Pyodide values pass through unchanged
+"""
+
+from typing import Any
+
+try:
+    from js import Object
+    from pyodide.ffi import to_js as _to_js
+    
+    def to_js(value: Any):
+        """Convert a value for a JS binding; dicts become plain objects, not Maps"""
+        return _to_js(value, dict_converter=Object.fromEntries)
+except ImportError:
+    def to_js(value: Any):
+        return value
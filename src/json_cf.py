@@ -0,0 +1,32 @@
+"""
+JSON serialization for Cloudflare Workers
+Uses orjson when the runtime provides it, falling back to stdlib json
+"""
+
+import json
+from datetime import datetime
+from typing import Any
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _json_default(obj):
+    """Fallback serializer for types stdlib json does not handle"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_json(data: Any, indent: bool = False) -> str:
+    """Serialize data to a JSON string; datetimes are written as ISO 8601
+    
+    With indent, output is pretty-printed with two-space indentation.
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option).decode('utf-8')
+    return json.dumps(data, default=_json_default, indent=2 if indent else None)
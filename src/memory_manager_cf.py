@@ -3,19 +3,55 @@ Cloudflare Memory Manager
 Adapted for Cloudflare Workers environment with D1, KV, and Workers AI
 """
 
-import json
-import uuid
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import asyncio
+import hashlib
+import logging
+import secrets
+import time
+from typing import Dict, List, Optional, Any, Sequence
+
+from .embeddings_cf import NUMPY_AVAILABLE, EmbeddingIndex
+from .ffi_cf import to_js
+
+logger = logging.getLogger(__name__)
+
+# KV key prefix for the default project id, so cold isolates skip start_session;
+# entries are keyed by UTC day because the default project rotates daily
+DEFAULT_PROJECT_KEY = 'default_project'
+
+# Default project id for the current UTC day, recomputed only when the day changes
+_today_cache = {'day': None, 'id': None}
 
 class CloudflareMemoryManager:
     """Memory manager adapted for Cloudflare Workers"""
     
-    def __init__(self, db_manager, embeddings, kv_cache):
-        """Initialize with Cloudflare service bindings"""
+    def __init__(self, db_manager, embeddings, kv_cache, vector_index=None, wait_until=None, r2_bucket=None):
+        """Initialize with Cloudflare service bindings
+        
+        wait_until is the runtime's ctx.waitUntil; when given, add_memory stores
+        the row first and embeds it in the background. With an R2 bucket, each
+        project's int8 embedding index is kept as a single R2 object.
+        """
         self.db_manager = db_manager
         self.embeddings = embeddings
         self.kv = kv_cache
+        self.vector_index = vector_index  # Optional Vectorize binding for ANN search
+        self.wait_until = wait_until
+        self.r2 = r2_bucket
+        
+        # Embedding indexes loaded from R2, by project id. The generation is
+        # bumped on every invalidation so an index built from an older D1 read
+        # is never cached or persisted over newer embeddings.
+        self._indexes: Dict[str, EmbeddingIndex] = {}
+        self._index_generation: Dict[str, int] = {}
+        self._pending_index_puts: Dict[str, asyncio.Future] = {}
+        
+        # Memories inserted without an embedding, drained by _embed_and_patch
+        self._embed_queue: List[tuple] = []
+        self._embed_scheduled = False
+        
+        # In-flight searches keyed by sha256 of (project, limit, query)
+        self._inflight_searches: Dict[bytes, asyncio.Future] = {}
         
         # Current session info
         self.current_project_id = None
@@ -24,9 +60,15 @@ class CloudflareMemoryManager:
     async def get_memory_context(self, query: str = "") -> str:
         """Get current memory context and task reminders"""
         try:
-            # Ensure we have a current project
+            # Ensure we have a current project; a cold isolate checks KV before D1
             if not self.current_project_id:
-                await self.start_session()
+                project_id = await self._get_cached_project()
+                if project_id:
+                    # Same project as the cached session, but this isolate's session is new
+                    self.session_id = secrets.token_hex(16)
+                    self.current_project_id = project_id
+                else:
+                    await self.start_session()
             
             context_parts = []
             
@@ -34,50 +76,81 @@ class CloudflareMemoryManager:
             context_parts.append(f"## Current Project: {self.current_project_id[:8]}...")
             context_parts.append("Description: Auto-detected project")
             
-            # Get relevant memories if query provided
+            # Memory search and pending tasks are independent D1 reads, so run them concurrently
             if query:
-                memories = await self._search_memories(query, limit=5)
-                if memories:
-                    context_parts.append("## 🧠 Relevant Memories")
-                    for memory in memories[:3]:  # Top 3 most relevant
-                        context_parts.append(f"### {memory.get('type', 'memory').title()}: {memory.get('title', 'Untitled')}")
-                        context_parts.append(memory.get('content', '')[:200] + "..." if len(memory.get('content', '')) > 200 else memory.get('content', ''))
-            
-            # Get pending tasks
-            tasks = await self.get_pending_tasks(limit=5)
+                memories, tasks = await asyncio.gather(
+                    self._search_memories(query, limit=5),
+                    self.get_pending_tasks(limit=5)
+                )
+            else:
+                memories, tasks = [], await self.get_pending_tasks(limit=5)
+            
+            # Add relevant memories if query provided
+            if memories:
+                context_parts.append("## 🧠 Relevant Memories")
+                for memory in memories[:3]:  # Top 3 most relevant
+                    mtype = memory.get('type', 'memory')
+                    title = memory.get('title', 'Untitled')
+                    content = memory.get('content') or ''
+                    preview = f"{content[:200]}..." if len(content) > 200 else content
+                    context_parts.append(f"### {mtype.title()}: {title}\n\n{preview}")
+            
+            # Add pending tasks
             if tasks:
                 context_parts.append("## Pending Tasks:")
-                for task in tasks:
-                    priority = task.get('priority', 'medium')
-                    context_parts.append(f"- [{priority}] {task.get('title', 'Untitled')}")
+                context_parts.extend(
+                    f"- [{task.get('priority', 'medium')}] {task.get('title', 'Untitled')}"
+                    for task in tasks
+                )
             
             # Add task reminder
             context_parts.append("## Task Reminder:")
             context_parts.append("Remember to create or update tasks for the current project as needed.")
             
-            return "\\n\\n".join(context_parts) if context_parts else "No context available"
+            return "\n\n".join(context_parts) if context_parts else "No context available"
             
         except Exception as e:
-            console.error(f"Error getting memory context: {e}")
+            logger.error(f"Error getting memory context: {e}")
             return f"Error retrieving context: {str(e)}"
     
     async def start_session(self):
         """Start a new session"""
-        self.session_id = str(uuid.uuid4())
+        self.session_id = secrets.token_hex(16)
         self.current_project_id = await self._get_or_create_default_project()
+        
+        # Expire at the end of the UTC day; KV requires a TTL of at least 60 seconds
+        now = time.time()
+        ttl = max(60, int(86400 - now % 86400))
+        try:
+            await self.kv.put(f"{DEFAULT_PROJECT_KEY}:{int(now // 86400)}", self.current_project_id, {'expirationTtl': ttl})
+        except Exception as e:
+            logger.error(f"Error caching default project: {e}")
+    
+    async def _get_cached_project(self) -> Optional[str]:
+        """Return today's default project id cached in KV by start_session, if any"""
+        try:
+            return await self.kv.get(f"{DEFAULT_PROJECT_KEY}:{int(time.time() // 86400)}")
+        except Exception as e:
+            logger.error(f"Error reading cached project: {e}")
+            return None
     
     async def _get_or_create_default_project(self) -> str:
         """Get or create a default project"""
         try:
-            # For now, create a simple project ID
-            project_id = f"project_{datetime.now().strftime('%Y%m%d')}"
+            # For now, create a simple project ID, one per day
+            day = int(time.time() // 86400)
+            if _today_cache['day'] != day:
+                _today_cache['id'] = f"project_{time.strftime('%Y%m%d', time.gmtime(day * 86400))}"
+                _today_cache['day'] = day
+            project_id = _today_cache['id']
             
-            # TODO: Implement proper project creation in D1
-            # For now, just return the ID
+            await self.db_manager.ensure_project(
+                project_id, name=project_id, description="Auto-detected project"
+            )
             return project_id
             
         except Exception as e:
-            console.error(f"Error creating project: {e}")
+            logger.error(f"Error creating project: {e}")
             return "default_project"
     
     async def create_task(self, title: str, description: str = "", priority: str = "medium", category: str = "feature") -> str:
@@ -98,7 +171,7 @@ class CloudflareMemoryManager:
             return task_id
             
         except Exception as e:
-            console.error(f"Error creating task: {e}")
+            logger.error(f"Error creating task: {e}")
             raise e
     
     async def get_pending_tasks(self, limit: int = 20) -> List[Dict[str, Any]]:
@@ -116,38 +189,170 @@ class CloudflareMemoryManager:
             return tasks
             
         except Exception as e:
-            console.error(f"Error getting pending tasks: {e}")
+            logger.error(f"Error getting pending tasks: {e}")
             return []
     
     async def _search_memories(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search memories using semantic similarity"""
+        """Search memories using semantic similarity
+        
+        Concurrent searches for the same query share a single embedding and D1 read.
+        """
+        key = hashlib.sha256(f"{self.current_project_id}:{limit}:{query}".encode('utf-8')).digest()
+        
+        pending = self._inflight_searches.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._run_search(query, limit))
+            self._inflight_searches[key] = pending
+            pending.add_done_callback(lambda done: self._inflight_searches.pop(key, None))
+        
+        # Shielded so a cancelled caller does not cancel the search other waiters share
+        return await asyncio.shield(pending)
+    
+    async def _run_search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Run one semantic memory search against Vectorize or D1"""
         try:
-            # TODO: Implement proper semantic search with embeddings
-            # For now, return empty list
+            # Approximate nearest-neighbour search when a Vectorize index is bound:
+            # only the top matches are hydrated from D1
+            if self.vector_index is not None:
+                query_embedding = await self.embeddings.generate_embedding(query)
+                if query_embedding:
+                    result = await self.vector_index.query(to_js(query_embedding), to_js({
+                        'topK': limit,
+                        'filter': {'project_id': self.current_project_id}
+                    }))
+                    memory_ids = [match.id for match in result.matches]
+                    if not memory_ids:
+                        return []
+                    return await self._hydrate_ranked(memory_ids, limit)
+            
+            # A packed index in R2 replaces reading every embedding from D1;
+            # only the top matches are hydrated
+            index = await self._load_index(self.current_project_id)
+            if index is not None:
+                query_embedding = await self.embeddings.generate_embedding(query)
+                if query_embedding:
+                    memory_ids = [match['id'] for match in index.query(query_embedding, threshold=0.3, top_k=limit)]
+                    if not memory_ids:
+                        return []
+                    return await self._hydrate_ranked(memory_ids, limit)
+            
+            generation = self._index_generation.get(self.current_project_id, 0)
             memories = await self.db_manager.get_memories(
-                project_id=self.current_project_id,
-                limit=limit
+                project_id=self.current_project_id
             )
             
-            # If we have embeddings available, do semantic search
-            if memories and self.embeddings:
-                # This would use the embeddings for similarity search
-                # For now, just return the memories as-is
-                pass
+            # Rank stored embeddings against the query in one vectorized pass
+            if memories and self.embeddings and any(memory.get('embedding') or memory.get('embedding_q8') for memory in memories):
+                query_embedding = await self.embeddings.generate_embedding(query)
+                if query_embedding:
+                    candidates = memories
+                    if NUMPY_AVAILABLE and self.r2 is not None:
+                        candidates = self.embeddings.build_index(memories)
+                        self._save_index(self.current_project_id, candidates, generation)
+                    return self.embeddings.rank_by_similarity(
+                        query_embedding, candidates, threshold=0.3, top_k=limit
+                    )
             
-            return memories
+            return memories[:limit]
             
         except Exception as e:
-            console.error(f"Error searching memories: {e}")
+            logger.error(f"Error searching memories: {e}")
             return []
     
+    async def _hydrate_ranked(self, memory_ids: List[str], limit: int) -> List[Dict[str, Any]]:
+        """Fetch ranked memories from D1, keeping the ranking order"""
+        rows = await self.db_manager.get_memories(
+            project_id=self.current_project_id,
+            memory_ids=memory_ids,
+            limit=limit
+        )
+        by_id = {row['id']: row for row in rows}
+        return [by_id[memory_id] for memory_id in memory_ids if memory_id in by_id]
+    
+    def _index_key(self, project_id: str) -> str:
+        return f"embeddings/{project_id}.idx"
+    
+    async def _load_index(self, project_id: str) -> Optional[EmbeddingIndex]:
+        """Return the project's packed embedding index from memory or R2, if stored"""
+        if self.r2 is None or not NUMPY_AVAILABLE:
+            return None
+        
+        index = self._indexes.get(project_id)
+        if index is None:
+            generation = self._index_generation.get(project_id, 0)
+            try:
+                obj = await self.r2.get(self._index_key(project_id))
+                if obj is None:
+                    return None
+                index = EmbeddingIndex.from_bytes((await obj.arrayBuffer()).to_bytes())
+            except Exception as e:
+                logger.error(f"Error loading embedding index: {e}")
+                return None
+            if self._index_generation.get(project_id, 0) == generation:
+                self._indexes[project_id] = index
+        return index
+    
+    def _save_index(self, project_id: str, index: EmbeddingIndex, generation: int):
+        """Cache and store the project's index, unless it was invalidated since generation
+        
+        The R2 put runs in the background when possible; _invalidate_index waits
+        for it before deleting, so a late put cannot restore a stale index.
+        """
+        if self._index_generation.get(project_id, 0) != generation:
+            return
+        
+        self._indexes[project_id] = index
+        put = asyncio.ensure_future(self._put_index(project_id, index.to_bytes()))
+        self._pending_index_puts[project_id] = put
+        if self.wait_until is not None:
+            self.wait_until(put)
+    
+    async def _put_index(self, project_id: str, blob: bytes):
+        """Write a packed index to R2"""
+        try:
+            await self.r2.put(self._index_key(project_id), to_js(blob))
+        except Exception as e:
+            logger.error(f"Error saving embedding index: {e}")
+    
+    async def _invalidate_index(self, project_id: str):
+        """Drop a project's stored index after its embeddings change; the next search rebuilds it"""
+        self._index_generation[project_id] = self._index_generation.get(project_id, 0) + 1
+        self._indexes.pop(project_id, None)
+        if self.r2 is None:
+            return
+        
+        pending = self._pending_index_puts.pop(project_id, None)
+        try:
+            if pending is not None:
+                await pending
+            await self.r2.delete(self._index_key(project_id))
+        except Exception as e:
+            logger.error(f"Error invalidating embedding index: {e}")
+    
     async def add_memory(self, memory_type: str, title: str, content: str, **kwargs) -> str:
         """Add a new memory"""
         try:
             if not self.current_project_id:
                 await self.start_session()
             
-            # Generate embedding for content
+            # Write-behind: insert the row now and embed it after the response
+            if self.wait_until is not None:
+                memory_id = await self.db_manager.add_memory(
+                    project_id=self.current_project_id,
+                    memory_type=memory_type,
+                    title=title,
+                    content=content,
+                    embedding=None,
+                    **kwargs
+                )
+                self._embed_queue.append((memory_id, content, self.current_project_id))
+                if not self._embed_scheduled:
+                    self._embed_scheduled = True
+                    self.wait_until(asyncio.ensure_future(self._embed_and_patch()))
+                return memory_id
+            
+            # Generate embedding for content; generate_embedding returns unit-length
+            # vectors, so search can score stored rows with a plain dot product
             embedding = await self.embeddings.generate_embedding(content)
             
             memory_id = await self.db_manager.add_memory(
@@ -156,11 +361,91 @@ class CloudflareMemoryManager:
                 title=title,
                 content=content,
                 embedding=embedding,
+                embedding_normalized=embedding is not None,
                 **kwargs
             )
             
+            if embedding:
+                await self._upsert_vectors([memory_id], [embedding], [self.current_project_id])
+                await self._invalidate_index(self.current_project_id)
+            
             return memory_id
             
         except Exception as e:
-            console.error(f"Error adding memory: {e}")
-            raise e
\ No newline at end of file
+            logger.error(f"Error adding memory: {e}")
+            raise e
+    
+    async def _upsert_vectors(self, memory_ids: Sequence[str], embeddings: Sequence[Optional[List[float]]],
+                              project_ids: Sequence[str]):
+        """Upsert embedded memories into Vectorize, skipping rows without an embedding"""
+        if self.vector_index is None:
+            return
+        vectors = [{
+            'id': memory_id,
+            'values': embedding,
+            'metadata': {'project_id': project_id}
+        } for memory_id, embedding, project_id in zip(memory_ids, embeddings, project_ids) if embedding]
+        if vectors:
+            await self.vector_index.upsert(to_js(vectors))
+    
+    async def _embed_and_patch(self):
+        """Embed queued memories in batches and write the vectors back
+        
+        Memories added while a batch is in flight are picked up by the next
+        pass, so one background task drains the queue. Memories that could
+        not be embedded go back on the queue and are retried by the next
+        scheduled pass rather than this one, so a failing model cannot spin.
+        """
+        retry: List[tuple] = []
+        pending: List[tuple] = []
+        try:
+            while self._embed_queue:
+                pending, self._embed_queue = self._embed_queue, []
+                memory_ids, contents, project_ids = zip(*pending)
+                
+                embeddings = await self.embeddings.generate_embeddings(list(contents))
+                await self.db_manager.update_embeddings(list(memory_ids), embeddings)
+                for project_id in set(project_ids):
+                    await self._invalidate_index(project_id)
+                
+                await self._upsert_vectors(memory_ids, embeddings, project_ids)
+                
+                retry.extend(item for item, embedding in zip(pending, embeddings) if embedding is None)
+                pending = []
+        except Exception as e:
+            logger.error(f"Error embedding queued memories: {e}")
+        finally:
+            # A failed pass leaves its whole batch in pending
+            self._embed_queue[:0] = retry + pending
+            self._embed_scheduled = False
+    
+    async def add_memories_bulk(self, items: List[Dict[str, Any]]) -> List[str]:
+        """Add several memories with batched embedding and a single D1 batch insert
+        
+        Each item is a dict with memory_type, title and content, plus optional
+        importance_score, tags and metadata.
+        """
+        try:
+            if not items:
+                return []
+            if not self.current_project_id:
+                await self.start_session()
+            
+            embeddings = await self.embeddings.generate_embeddings([item['content'] for item in items])
+            
+            rows = [{
+                **item,
+                'project_id': self.current_project_id,
+                'embedding': embedding,
+                'embedding_normalized': embedding is not None
+            } for item, embedding in zip(items, embeddings)]
+            memory_ids = await self.db_manager.add_memories(rows)
+            
+            await self._upsert_vectors(memory_ids, embeddings, [self.current_project_id] * len(memory_ids))
+            await self._invalidate_index(self.current_project_id)
+            
+            return memory_ids
+            
+        except Exception as e:
+            logger.error(f"Error adding memories in bulk: {e}")
+            raise e
@@ -3,19 +3,110 @@ Sequential Thinking Engine for Cloudflare Workers
 Adapted for cloud environment with Workers AI integration
 """
 
-import json
-import uuid
-from datetime import datetime
+import bisect
+import logging
+import re
+import secrets
+import time
+from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any
 
+from .embeddings_cf import encode_embedding
+from .json_cf import dumps_json
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+TRUNCATION_MARKER = "... [content truncated]"
+
+# End of a sentence: terminal punctuation followed by whitespace
+_SENTENCE_END = re.compile(r'[.!?](?=\s)')
+
+_encoder = None
+
+def _get_encoder():
+    """Return the process-wide cl100k_base encoder, or None if unavailable"""
+    global _encoder, TIKTOKEN_AVAILABLE
+    if _encoder is None and TIKTOKEN_AVAILABLE:
+        try:
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # Encoding data could not be loaded; fall back to the char estimate
+            logger.error(f"tiktoken encoding unavailable: {e}")
+            TIKTOKEN_AVAILABLE = False
+    return _encoder
+
+class ChainBuffer:
+    """Column-oriented buffer of thinking steps awaiting a batched D1 insert"""
+    
+    COLUMNS = ('id', 'chain_id', 'step_idx', 'stage', 'title', 'content',
+               'reasoning', 'confidence', 'created_at')
+    
+    def __init__(self):
+        """Initialize empty columns"""
+        self.columns: Dict[str, List[Any]] = {name: [] for name in self.COLUMNS}
+        self._next_step_idx: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+    
+    def has_chain(self, chain_id: str) -> bool:
+        """Whether the next step index of chain_id is already known"""
+        return chain_id in self._next_step_idx
+    
+    def seed_chain(self, chain_id: str, next_step_idx: int):
+        """Set the next step index of a chain unless it is already tracked"""
+        self._next_step_idx.setdefault(chain_id, next_step_idx)
+    
+    def append(self, step_id: str, chain_id: str, stage: str, title: str, content: str,
+               reasoning: str, confidence: float, created_at: float) -> int:
+        """Buffer one step and return its index within the chain"""
+        step_idx = self._next_step_idx.get(chain_id, 0)
+        self._next_step_idx[chain_id] = step_idx + 1
+        
+        values = (step_id, chain_id, step_idx, stage, title, content, reasoning, confidence, created_at)
+        for name, value in zip(self.COLUMNS, values):
+            self.columns[name].append(value)
+        return step_idx
+    
+    def drain(self) -> Dict[str, List[Any]]:
+        """Return buffered columns and start a new empty buffer"""
+        columns = self.columns
+        self.columns = {name: [] for name in self.COLUMNS}
+        return columns
+    
+    def restore(self, columns: Dict[str, List[Any]]):
+        """Put drained columns back in front of the buffer after a failed write"""
+        for name in self.COLUMNS:
+            self.columns[name][:0] = columns[name]
+    
+    def forget(self, columns: Dict[str, List[Any]]):
+        """Drop the step counters of chains in discarded columns
+        
+        Their next step index is read from D1 again, so discarded steps leave no gap.
+        """
+        for chain_id in set(columns['chain_id']):
+            self._next_step_idx.pop(chain_id, None)
+
 class CloudflareSequentialThinking:
     """Sequential thinking engine adapted for Cloudflare Workers"""
     
-    def __init__(self, db_manager, memory_manager, embeddings):
-        """Initialize with Cloudflare service bindings"""
+    def __init__(self, db_manager, memory_manager, embeddings, buffer_steps: bool = False):
+        """Initialize with Cloudflare service bindings
+        
+        With buffer_steps, thinking steps are held until flush_thinking_steps()
+        stores them with one batched embedding call and one D1 batch.
+        """
         self.db_manager = db_manager
         self.memory_manager = memory_manager
         self.embeddings = embeddings
+        self.buffer_steps = buffer_steps
+        self._step_buffer = ChainBuffer()
         
         # Thinking stages
         self.stages = [
@@ -25,16 +116,21 @@ class CloudflareSequentialThinking:
             "validation",
             "reflection"
         ]
+        self._next_stage = {
+            stage: self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for i, stage in enumerate(self.stages)
+        }
     
     async def start_thinking_chain(self, objective: str) -> Dict[str, Any]:
         """Start a new thinking chain"""
         try:
-            chain_id = str(uuid.uuid4())
+            chain_id = secrets.token_hex(16)
+            self._step_buffer.seed_chain(chain_id, 0)
             
             chain_data = {
                 'id': chain_id,
                 'objective': objective,
-                'started_at': datetime.now().isoformat(),
+                'started_at': datetime.now(timezone.utc),
                 'current_stage': 'analysis',
                 'steps': [],
                 'status': 'active'
@@ -44,10 +140,15 @@ class CloudflareSequentialThinking:
             await self.memory_manager.add_memory(
                 memory_type='thinking_chain',
                 title=f'Thinking Chain: {objective[:50]}...',
-                content=json.dumps(chain_data),
+                content=dumps_json(chain_data),
                 metadata={'chain_id': chain_id, 'type': 'chain_start'}
             )
             
+            # chain_steps references thinking_chains, so the chain row must exist before any step
+            await self.db_manager.add_thinking_chain(
+                chain_id, self.memory_manager.current_project_id, objective
+            )
+            
             return {
                 'chain_id': chain_id,
                 'objective': objective,
@@ -61,37 +162,31 @@ class CloudflareSequentialThinking:
             }
             
         except Exception as e:
-            console.error(f"Error starting thinking chain: {e}")
+            logger.error(f"Error starting thinking chain: {e}")
             return {'error': str(e)}
     
-    async def add_thinking_step(self, chain_id: str, stage: str, title: str, content: str, reasoning: str = "", confidence: float = 0.7) -> Dict[str, Any]:
-        """Add a step to a thinking chain"""
+    async def add_thinking_step(self, chain_id: str, stage: str, title: str, content: str, reasoning: str = "", confidence: float = 0.7, created_at: Optional[float] = None) -> Dict[str, Any]:
+        """Add a step to a thinking chain
+        
+        created_at is a UNIX timestamp; callers adding several steps in one
+        request can pass the same value instead of reading the clock per step.
+        """
         try:
-            step_id = str(uuid.uuid4())
+            step_id = secrets.token_hex(16)
+            if created_at is None:
+                created_at = time.time()
             
-            step_data = {
-                'id': step_id,
-                'chain_id': chain_id,
-                'stage': stage,
-                'title': title,
-                'content': content,
-                'reasoning': reasoning,
-                'confidence': confidence,
-                'created_at': datetime.now().isoformat()
-            }
+            # Step indexes are persisted, so a chain this instance has not seen
+            # continues after the last step stored in D1
+            if not self._step_buffer.has_chain(chain_id):
+                self._step_buffer.seed_chain(chain_id, await self.db_manager.get_next_step_idx(chain_id))
             
-            # Store as memory
-            await self.memory_manager.add_memory(
-                memory_type='thinking_step',
-                title=f'{stage.title()} Step: {title}',
-                content=f"Content: {content}\\n\\nReasoning: {reasoning}",
-                metadata={
-                    'chain_id': chain_id,
-                    'step_id': step_id,
-                    'stage': stage,
-                    'confidence': confidence
-                }
+            # Buffer the step; it is written to chain_steps on flush
+            step_idx = self._step_buffer.append(
+                step_id, chain_id, stage, title, content, reasoning, confidence, created_at
             )
+            if not self.buffer_steps:
+                await self.flush_thinking_steps()
             
             # Determine next stage
             next_stage = self._get_next_stage(stage)
@@ -99,6 +194,7 @@ class CloudflareSequentialThinking:
             return {
                 'step_id': step_id,
                 'chain_id': chain_id,
+                'step_index': step_idx,
                 'stage': stage,
                 'title': title,
                 'confidence': confidence,
@@ -107,34 +203,64 @@ class CloudflareSequentialThinking:
             }
             
         except Exception as e:
-            console.error(f"Error adding thinking step: {e}")
+            logger.error(f"Error adding thinking step: {e}")
             return {'error': str(e)}
     
-    def _get_next_stage(self, current_stage: str) -> Optional[str]:
-        """Get the next stage in the thinking process"""
+    async def flush_thinking_steps(self) -> List[str]:
+        """Store all buffered thinking steps with one embedding batch and one D1 batch
+        
+        If the write fails in buffered mode the steps are put back in the buffer
+        for the next flush. Unbuffered steps are discarded instead: the caller
+        already got the error, and a retry would otherwise write them twice.
+        """
+        if not len(self._step_buffer):
+            return []
+        
+        steps = self._step_buffer.drain()
         try:
-            current_index = self.stages.index(current_stage)
-            if current_index < len(self.stages) - 1:
-                return self.stages[current_index + 1]
-            return None  # We're at the last stage
-        except ValueError:
-            # Unknown stage, default to analysis
-            return "analysis"
+            texts = [f"{content}\n\n{reasoning}" for content, reasoning in zip(steps['content'], steps['reasoning'])]
+            embeddings = await self.embeddings.generate_embeddings(texts)
+            await self.db_manager.add_chain_steps({
+                **steps,
+                'embedding': [encode_embedding(e) if e is not None else None for e in embeddings]
+            })
+        except Exception:
+            if self.buffer_steps:
+                self._step_buffer.restore(steps)
+            else:
+                self._step_buffer.forget(steps)
+            raise
+        return steps['id']
+    
+    def _get_next_stage(self, current_stage: str) -> Optional[str]:
+        """Get the next stage in the thinking process
+        
+        Returns None after the last stage and "analysis" for unknown stages.
+        """
+        return self._next_stage.get(current_stage, "analysis")
     
     async def get_thinking_chain(self, chain_id: str) -> Dict[str, Any]:
-        """Retrieve a complete thinking chain with all steps"""
+        """Retrieve a complete thinking chain with all steps
+        
+        Steps are returned column-wise: one list per field, in step order.
+        """
         try:
-            # TODO: Implement proper retrieval from database
-            # This would search for all memories with matching chain_id
+            rows = await self.db_manager.get_chain_steps(chain_id)
             
             return {
                 'chain_id': chain_id,
-                'status': 'placeholder',
-                'message': 'Full thinking chain retrieval not yet implemented'
+                'step_count': len(rows),
+                'step_ids': [row['id'] for row in rows],
+                'stages': [row['stage'] for row in rows],
+                'titles': [row['title'] for row in rows],
+                'contents': [row['content'] for row in rows],
+                'reasonings': [row['reasoning'] for row in rows],
+                'confidences': [row['confidence'] for row in rows],
+                'created_at': [row['created_at'] for row in rows]
             }
             
         except Exception as e:
-            console.error(f"Error getting thinking chain: {e}")
+            logger.error(f"Error getting thinking chain: {e}")
             return {'error': str(e)}
     
     async def list_thinking_chains(self, limit: int = 10) -> List[Dict[str, Any]]:
@@ -149,18 +275,29 @@ class CloudflareSequentialThinking:
             }]
             
         except Exception as e:
-            console.error(f"Error listing thinking chains: {e}")
+            logger.error(f"Error listing thinking chains: {e}")
             return [{'error': str(e)}]
     
-    async def estimate_tokens(self, text: str) -> int:
-        """Estimate token count for text"""
-        # Simple approximation: ~4 characters per token
+    def estimate_tokens(self, text: str) -> int:
+        """Estimate token count for text
+        
+        Uses the tiktoken cl100k_base encoder when available, otherwise
+        approximates ~4 characters per token.
+        """
+        encoder = _get_encoder()
+        if encoder is not None:
+            return max(1, len(encoder.encode(text, disallowed_special=())))
         return max(1, len(text) // 4)
     
     async def compress_context(self, content: str, target_tokens: int) -> Dict[str, Any]:
         """Compress content to fit within token limit"""
         try:
-            current_tokens = await self.estimate_tokens(content)
+            encoder = _get_encoder()
+            if encoder is not None:
+                token_ids = encoder.encode(content, disallowed_special=())
+                current_tokens = max(1, len(token_ids))
+            else:
+                current_tokens = self.estimate_tokens(content)
             
             if current_tokens <= target_tokens:
                 return {
@@ -170,10 +307,29 @@ class CloudflareSequentialThinking:
                     'compression_ratio': 1.0
                 }
             
-            # Simple compression: truncate to target length
-            target_chars = target_tokens * 4
-            compressed = content[:target_chars] + "... [content truncated]"
-            compressed_tokens = await self.estimate_tokens(compressed)
+            # The marker is part of the output, so it comes out of the budget
+            budget = max(0, target_tokens - self.estimate_tokens(TRUNCATION_MARKER))
+            
+            # Upper bound for the cut: the character length of the budget token prefix
+            if encoder is not None:
+                prefix = encoder.decode(token_ids[:budget])
+            else:
+                prefix = content[:budget * 4]
+            
+            # Binary-search the last sentence boundary whose output fits the target
+            boundaries = [m.end() for m in _SENTENCE_END.finditer(content, 0, len(prefix))]
+            lo, hi = 0, bisect.bisect_right(boundaries, len(prefix))
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.estimate_tokens(content[:boundaries[mid]] + TRUNCATION_MARKER) <= target_tokens:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            
+            # Fall back to the raw token prefix when no whole sentence fits
+            cut = content[:boundaries[lo - 1]] if lo else prefix
+            compressed = cut + TRUNCATION_MARKER
+            compressed_tokens = self.estimate_tokens(compressed)
             
             return {
                 'compressed_content': compressed,
@@ -183,5 +339,5 @@ class CloudflareSequentialThinking:
             }
             
         except Exception as e:
-            console.error(f"Error compressing context: {e}")
-            return {'error': str(e)}
\ No newline at end of file
+            logger.error(f"Error compressing context: {e}")
+            return {'error': str(e)}
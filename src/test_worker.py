@@ -3,84 +3,112 @@ Test Python Worker for Cloudflare
 Simplified version to test deployment
 """
 
-import json
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
 
-async def on_fetch(request, env):
-    """Main entry point for HTTP requests"""
-    
-    # Get request details
-    url = str(request.url)
-    method = request.method
+from js import Response
+
+# wrangler.toml deploys this file as the main module, so siblings are imported top-level
+from ffi_cf import to_js
+from json_cf import dumps_json
+
+_JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+# Static leading part of the /health body; only the tail is serialized per request
+_HEALTH_PREFIX = '{"status":"healthy","worker":"enhanced-mcp-memory","runtime":"python","timestamp":'
+
+# Last /health timestamp as (epoch seconds, encoded JSON string), refreshed at most once per second
+_last_timestamp = [0.0, '"1970-01-01T00:00:00Z"']
+
+# Default-route payload never changes, so serialize it once at import
+_DEFAULT_BODY = dumps_json({
+    'message': 'Enhanced MCP Memory Worker (Python)',
+    'endpoints': [
+        '/health - Health check',
+        '/test-d1 - Test D1 database',
+        '/test-kv - Test KV namespace'
+    ],
+    'runtime': 'python-workers',
+    'version': '0.1.0'
+})
+
+def _response(body: str, status: int = 200):
+    """Wrap a serialized JSON body in a runtime Response"""
+    return Response(body, to_js({'status': status, 'headers': _JSON_HEADERS}))
+
+def _json_response(data, status: int = 200):
+    """Serialize data and wrap it in a runtime Response"""
+    return _response(dumps_json(data), status)
+
+async def _health(request, env):
+    """Health check with service binding status"""
+    now = time.time()
+    if now - _last_timestamp[0] > 1.0:
+        _last_timestamp[0] = now
+        _last_timestamp[1] = dumps_json(datetime.fromtimestamp(now, timezone.utc))
     
-    # Basic routing
-    if '/health' in url:
-        return Response.json({
-            'status': 'healthy',
-            'worker': 'enhanced-mcp-memory',
-            'runtime': 'python',
-            'timestamp': datetime.now().isoformat(),
-            'services': {
-                'd1_connected': bool(env.DB),
-                'kv_connected': bool(env.KV_CACHE),
-                'r2_connected': bool(env.R2_STORAGE),
-                'ai_connected': bool(env.AI)
-            }
+    body = ''.join((
+        _HEALTH_PREFIX,
+        _last_timestamp[1],
+        ',"services":',
+        dumps_json({
+            'd1_connected': bool(env.DB),
+            'kv_connected': bool(env.KV_CACHE),
+            'r2_connected': bool(env.R2_STORAGE),
+            'ai_connected': bool(env.AI)
+        }),
+        '}'
+    ))
+    return _response(body)
+
+async def _test_d1(request, env):
+    """Test D1 database"""
+    try:
+        result = await env.DB.prepare("SELECT 1 as test").first()
+        return _json_response({
+            'success': True,
+            'd1_test': result,
+            'message': 'D1 database connection successful'
         })
-    
-    elif '/test-d1' in url:
-        # Test D1 database
-        try:
-            result = await env.DB.prepare("SELECT 1 as test").first()
-            return Response.json({
-                'success': True,
-                'd1_test': result,
-                'message': 'D1 database connection successful'
-            })
-        except Exception as e:
-            return Response.json({
-                'success': False,
-                'error': str(e)
-            }, status=500)
-    
-    elif '/test-kv' in url:
-        # Test KV namespace
-        try:
-            # Write and read test value
-            await env.KV_CACHE.put('test_key', 'test_value')
-            value = await env.KV_CACHE.get('test_key')
-            return Response.json({
-                'success': True,
-                'kv_test': value,
-                'message': 'KV namespace connection successful'
-            })
-        except Exception as e:
-            return Response.json({
-                'success': False,
-                'error': str(e)
-            }, status=500)
-    
-    else:
-        # Default response
-        return Response.json({
-            'message': 'Enhanced MCP Memory Worker (Python)',
-            'endpoints': [
-                '/health - Health check',
-                '/test-d1 - Test D1 database',
-                '/test-kv - Test KV namespace'
-            ],
-            'runtime': 'python-workers',
-            'version': '0.1.0'
+    except Exception as e:
+        return _json_response({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+async def _test_kv(request, env):
+    """Test KV namespace"""
+    try:
+        # Write and read test value
+        await env.KV_CACHE.put('test_key', 'test_value')
+        value = await env.KV_CACHE.get('test_key')
+        return _json_response({
+            'success': True,
+            'kv_test': value,
+            'message': 'KV namespace connection successful'
         })
+    except Exception as e:
+        return _json_response({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+async def _default(request, env):
+    """Default response listing available endpoints"""
+    return _response(_DEFAULT_BODY)
+
+_ROUTES = {
+    '/health': _health,
+    '/test-d1': _test_d1,
+    '/test-kv': _test_kv
+}
 
-class Response:
-    @staticmethod
-    def json(data, status=200):
-        return Response(
-            json.dumps(data),
-            status=status,
-            headers={
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            }
-        )
\ No newline at end of file
+async def on_fetch(request, env):
+    """Main entry point for HTTP requests"""
+    path = urlsplit(str(request.url)).path
+    handler = _ROUTES.get(path, _default)
+    return await handler(request, env)
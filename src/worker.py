@@ -3,29 +3,180 @@ Enhanced MCP Memory Server for Cloudflare Workers
 Main entry point and Durable Object implementation
 """
 
-import os
-import json
-import logging
+import asyncio
+import hashlib
+import inspect
 import time
+from array import array
+from collections import Counter
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-from pathlib import Path
+from urllib.parse import urlsplit
+from typing import AsyncIterator, Dict, Optional, Any, Tuple
 
-# Import Cloudflare Workers runtime
-from js import Request, Response, console
-from pyodide.ffi import create_proxy
-
-try:
-    from fastmcp import FastMCP, Context
-except ImportError as e:
-    console.error("FastMCP not available - this is expected in Cloudflare Workers environment")
-    # We'll implement a lightweight MCP protocol handler instead
+# Import Cloudflare Workers runtime; MCP is handled by the lightweight
+# JSON-RPC dispatcher below, so FastMCP is not imported here
+from js import Response, TextEncoder, TransformStream, console
 
 # Import our adapted modules (will need to be created/adapted)
 from .database_d1 import D1DatabaseManager
 from .memory_manager_cf import CloudflareMemoryManager
 from .sequential_thinking_cf import CloudflareSequentialThinking
-from .embeddings_cf import CloudflareEmbeddings
+from .embeddings_cf import CloudflareEmbeddings, EmbeddingCache
+from .json_cf import dumps_json
+
+# MCP tools exposed by MemoryManagerMCP; each name is a coroutine method on the class
+_TOOL_NAMES = (
+    # Core Memory Tools
+    'health_check',
+    'get_memory_context',
+    'create_task',
+    'get_tasks',
+    'update_task_status',
+    'get_project_summary',
+    
+    # Sequential Thinking Tools
+    'start_thinking_chain',
+    'add_thinking_step',
+    'get_thinking_chain',
+    'list_thinking_chains',
+    
+    # Context Management Tools
+    'create_context_summary',
+    'start_new_chat_session',
+    'consolidate_current_session',
+    'get_optimized_context',
+    'estimate_token_usage',
+    
+    # Auto-Processing Tools
+    'auto_process_conversation',
+    'decompose_task',
+    
+    # Project Convention Tools
+    'auto_learn_project_conventions',
+    'get_project_conventions',
+    'suggest_correct_command',
+    'remember_project_pattern',
+    'update_memory_context',
+    
+    # System Management Tools
+    'get_performance_stats',
+    'cleanup_old_data',
+    'optimize_memories',
+    'get_database_stats',
+)
+_TOOL_NAME_SET = frozenset(_TOOL_NAMES)
+_TOOL_INDEX = {name: i for i, name in enumerate(_TOOL_NAMES)}
+
+# Seconds a get_memory_context result is served from KV
+CONTEXT_CACHE_TTL = 30
+
+# Prefix of the message the memory manager returns when building a context fails
+_CONTEXT_ERROR_PREFIX = "Error retrieving context:"
+
+def _context_key(normalized_query: str) -> str:
+    """KV key for a cached get_memory_context result"""
+    return "ctx:" + hashlib.sha1(normalized_query.encode('utf-8')).hexdigest()[:16]
+
+# The empty-query context is the one every session starts from
+_DEFAULT_CONTEXT_KEY = _context_key("")
+
+# Read-only tools with cached results that may be run ahead of the client asking
+_PREFETCHABLE_TOOLS = frozenset({'get_memory_context'})
+
+# Tools that write data; nothing is prefetched right after them
+_WRITE_TOOLS = frozenset({
+    'create_task',
+    'update_task_status',
+    'start_thinking_chain',
+    'add_thinking_step',
+    'create_context_summary',
+    'start_new_chat_session',
+    'consolidate_current_session',
+    'auto_process_conversation',
+    'decompose_task',
+    'auto_learn_project_conventions',
+    'remember_project_pattern',
+    'update_memory_context',
+    'cleanup_old_data',
+    'optimize_memories',
+})
+
+# Times a tool-to-tool transition must be seen before its successor is prefetched
+PREFETCH_MIN_SUPPORT = 3
+
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+}
+_JSON_HEADERS = {'Content-Type': 'application/json', **_CORS_HEADERS}
+_NDJSON_HEADERS = {'Content-Type': 'application/x-ndjson', **_CORS_HEADERS}
+
+# The initialize result is constant; _reply_json splices in the request id per call
+_INIT_RESULT_JSON = dumps_json({
+    'protocolVersion': '2024-11-05',
+    'capabilities': {
+        'tools': {},
+        'resources': {},
+        'prompts': {}
+    },
+    'serverInfo': {
+        'name': 'enhanced-mcp-memory-cf',
+        'version': '2.0.8-cloudflare'
+    }
+})
+
+def _is_request_object(message: Any) -> bool:
+    """Whether a message is a JSON-RPC object naming a method"""
+    return isinstance(message, dict) and 'method' in message
+
+def _is_notification(message: Any) -> bool:
+    """JSON-RPC notifications carry a method but no id and must not be answered
+    
+    Malformed messages are not notifications; they always get an error reply.
+    """
+    return _is_request_object(message) and 'id' not in message
+
+def _reply_json(result_json: str, request_id: Optional[str] = None) -> str:
+    """Wrap an already serialized result in a JSON-RPC reply without re-encoding it"""
+    if request_id is None:
+        return f'{{"jsonrpc": "2.0", "result": {result_json}}}'
+    return f'{{"jsonrpc": "2.0", "result": {result_json}, "id": {dumps_json(request_id)}}}'
+
+def _text_content_json(text: str) -> str:
+    """Serialize a tools/call result carrying a single text block"""
+    return f'{{"content": [{{"type": "text", "text": {dumps_json(text)}}}]}}'
+
+def _tool_failure_json(error: Exception) -> str:
+    """Serialize the text a tools/call result carries when the tool raised"""
+    return dumps_json({'error': f'Tool execution failed: {str(error)}'})
+
+def _placeholder(name: str) -> str:
+    """Serialized reply for a tool that is not implemented yet"""
+    return dumps_json({"placeholder": f"{name} implementation needed"})
+
+# Placeholder replies are constants, so serialize them once at import
+_PH_GET_TASKS = _placeholder('get_tasks')
+_PH_UPDATE_TASK_STATUS = _placeholder('update_task_status')
+_PH_GET_PROJECT_SUMMARY = _placeholder('get_project_summary')
+_PH_START_THINKING_CHAIN = _placeholder('start_thinking_chain')
+_PH_ADD_THINKING_STEP = _placeholder('add_thinking_step')
+_PH_GET_THINKING_CHAIN = _placeholder('get_thinking_chain')
+_PH_LIST_THINKING_CHAINS = _placeholder('list_thinking_chains')
+_PH_CREATE_CONTEXT_SUMMARY = _placeholder('create_context_summary')
+_PH_START_NEW_CHAT_SESSION = _placeholder('start_new_chat_session')
+_PH_CONSOLIDATE_CURRENT_SESSION = _placeholder('consolidate_current_session')
+_PH_GET_OPTIMIZED_CONTEXT = _placeholder('get_optimized_context')
+_PH_ESTIMATE_TOKEN_USAGE = _placeholder('estimate_token_usage')
+_PH_AUTO_PROCESS_CONVERSATION = _placeholder('auto_process_conversation')
+_PH_DECOMPOSE_TASK = _placeholder('decompose_task')
+_PH_AUTO_LEARN_PROJECT_CONVENTIONS = _placeholder('auto_learn_project_conventions')
+_PH_GET_PROJECT_CONVENTIONS = _placeholder('get_project_conventions')
+_PH_SUGGEST_CORRECT_COMMAND = _placeholder('suggest_correct_command')
+_PH_REMEMBER_PROJECT_PATTERN = _placeholder('remember_project_pattern')
+_PH_UPDATE_MEMORY_CONTEXT = _placeholder('update_memory_context')
+_PH_CLEANUP_OLD_DATA = _placeholder('cleanup_old_data')
+_PH_OPTIMIZE_MEMORIES = _placeholder('optimize_memories')
 
 class MemoryManagerMCP:
     """
@@ -44,14 +195,18 @@ class MemoryManagerMCP:
         self.kv = env.KV_CACHE  # KV namespace
         self.ai = env.AI  # Workers AI
         self.r2 = env.R2_STORAGE  # R2 bucket
+        self.vectorize = getattr(env, 'VECTORIZE', None)  # Optional Vectorize index
         
         # Initialize our adapted components
         self.db_manager = D1DatabaseManager(self.db)
-        self.embeddings = CloudflareEmbeddings(self.ai)
+        self.embeddings = EmbeddingCache(CloudflareEmbeddings(self.ai), self.kv, wait_until=ctx.waitUntil)
         self.memory_manager = CloudflareMemoryManager(
             self.db_manager, 
             self.embeddings,
-            self.kv
+            self.kv,
+            self.vectorize,
+            wait_until=ctx.waitUntil,
+            r2_bucket=self.r2
         )
         self.thinking_engine = CloudflareSequentialThinking(
             self.db_manager, 
@@ -59,189 +214,239 @@ class MemoryManagerMCP:
             self.embeddings
         )
         
-        # MCP tools registry
-        self.tools = self._register_tools()
+        # Default memory context started during initialize, consumed by get_memory_context
+        self._ctx_prefetch = None
         
         # Performance tracking
-        self.start_time = datetime.now()
-        self.call_counts = {}
+        self._mono_start = time.monotonic()
+        self._call_counts = array('Q', [0]) * len(_TOOL_NAMES)  # Indexed like _TOOL_NAMES
         
-    def _register_tools(self) -> Dict[str, Any]:
-        """Register all MCP tools"""
-        tools = {}
+        # Observed tool-to-tool transitions, used to prefetch the likely next call
+        self._last_tool = None
+        self._successors: Dict[str, Counter] = {}
         
-        # Core Memory Tools
-        tools['health_check'] = self.health_check
-        tools['get_memory_context'] = self.get_memory_context
-        tools['create_task'] = self.create_task
-        tools['get_tasks'] = self.get_tasks
-        tools['update_task_status'] = self.update_task_status
-        tools['get_project_summary'] = self.get_project_summary
-        
-        # Sequential Thinking Tools  
-        tools['start_thinking_chain'] = self.start_thinking_chain
-        tools['add_thinking_step'] = self.add_thinking_step
-        tools['get_thinking_chain'] = self.get_thinking_chain
-        tools['list_thinking_chains'] = self.list_thinking_chains
-        
-        # Context Management Tools
-        tools['create_context_summary'] = self.create_context_summary
-        tools['start_new_chat_session'] = self.start_new_chat_session
-        tools['consolidate_current_session'] = self.consolidate_current_session
-        tools['get_optimized_context'] = self.get_optimized_context
-        tools['estimate_token_usage'] = self.estimate_token_usage
-        
-        # Auto-Processing Tools
-        tools['auto_process_conversation'] = self.auto_process_conversation
-        tools['decompose_task'] = self.decompose_task
-        
-        # Project Convention Tools
-        tools['auto_learn_project_conventions'] = self.auto_learn_project_conventions
-        tools['get_project_conventions'] = self.get_project_conventions
-        tools['suggest_correct_command'] = self.suggest_correct_command
-        tools['remember_project_pattern'] = self.remember_project_pattern
-        tools['update_memory_context'] = self.update_memory_context
-        
-        # System Management Tools
-        tools['get_performance_stats'] = self.get_performance_stats
-        tools['cleanup_old_data'] = self.cleanup_old_data
-        tools['optimize_memories'] = self.optimize_memories
-        tools['get_database_stats'] = self.get_database_stats
-        
-        return tools
-    
     async def fetch(self, request):
         """Handle HTTP requests - main entry point for MCP communication"""
         try:
-            url = request.url
             method = request.method
             
             # Handle CORS preflight
             if method == 'OPTIONS':
                 return self._cors_response()
             
-            # Parse request path
-            if '/mcp' in url:
-                return await self._handle_mcp_request(request)
-            elif '/health' in url:
-                return await self._handle_health_check(request)
-            else:
-                return self._json_response({
-                    'error': 'Not found',
-                    'available_endpoints': ['/mcp', '/health']
-                }, 404)
+            # Route on the parsed path, ignoring a trailing slash
+            handler = _ROUTES.get(urlsplit(str(request.url)).path.rstrip('/'))
+            if handler is not None:
+                return await handler(self, request)
+            return self._json_response({
+                'error': 'Not found',
+                'available_endpoints': list(_ROUTES)
+            }, 404)
                 
         except Exception as e:
             console.error(f"Error handling request: {e}")
             return self._json_response({'error': str(e)}, 500)
     
     async def _handle_mcp_request(self, request):
-        """Handle MCP protocol requests"""
+        """Handle MCP protocol requests, including JSON-RPC batch arrays"""
+        body = None
         try:
             # Parse request body
             body = await request.json() if request.method == 'POST' else {}
+            if hasattr(body, 'to_py'):
+                body = body.to_py()
+            
+            if isinstance(body, list):
+                if not body:
+                    return self._mcp_error('Empty batch')
+                # Messages in a batch are independent, so dispatch them concurrently
+                replies = await asyncio.gather(*(self._dispatch_one(message) for message in body))
+                
+                # Notifications (messages without an id) get no reply; a batch of
+                # only notifications gets no body at all
+                replies = [
+                    reply for message, (reply, _) in zip(body, replies)
+                    if not _is_notification(message)
+                ]
+                if not replies:
+                    return Response(None, {'status': 202, 'headers': _CORS_HEADERS})
+                return Response('[' + ', '.join(replies) + ']', {'status': 200, 'headers': _JSON_HEADERS})
+            
+            # Long-running tools stream NDJSON frames to clients that accept them
+            if (
+                isinstance(body, dict)
+                and body.get('method') == 'tools/call'
+                and body.get('params', {}).get('name') in _STREAMING_TOOLS
+                and 'application/x-ndjson' in (request.headers.get('Accept') or '')
+            ):
+                params = body['params']
+                return self._stream_tool(
+                    params['name'],
+                    params.get('arguments', {}),
+                    body.get('id'),
+                    (params.get('_meta') or {}).get('progressToken')
+                )
+            
+            reply, status = await self._dispatch_one(body)
+            if _is_notification(body):
+                return Response(None, {'status': 202, 'headers': _CORS_HEADERS})
+            return Response(reply, {'status': status, 'headers': _JSON_HEADERS})
+                
+        except Exception as e:
+            console.error(f"MCP request error: {e}")
+            return self._mcp_error(str(e), body.get('id') if isinstance(body, dict) else None)
+    
+    async def _dispatch_one(self, message: Dict[str, Any]) -> Tuple[str, int]:
+        """Handle a single JSON-RPC message and return its serialized reply and HTTP status"""
+        request_id = None
+        try:
+            if not _is_request_object(message):
+                request_id = message.get('id') if isinstance(message, dict) else None
+                return self._mcp_error_message('Invalid request: expected a JSON-RPC object with a method', request_id), 400
             
             # Extract MCP method and parameters
-            method = body.get('method')
-            params = body.get('params', {})
-            request_id = body.get('id')
+            method = message.get('method')
+            params = message.get('params', {})
+            request_id = message.get('id')
             
             # Handle different MCP methods
             if method == 'initialize':
-                return self._mcp_response({
-                    'protocolVersion': '2024-11-05',
-                    'capabilities': {
-                        'tools': {},
-                        'resources': {},
-                        'prompts': {}
-                    },
-                    'serverInfo': {
-                        'name': 'enhanced-mcp-memory-cf',
-                        'version': '2.0.8-cloudflare'
-                    }
-                }, request_id)
+                # Start building the default context while the client finishes the handshake
+                if self._ctx_prefetch is None:
+                    self._ctx_prefetch = asyncio.ensure_future(self.memory_manager.get_memory_context(""))
+                    self.ctx.waitUntil(self._ctx_prefetch)
+                return _reply_json(_INIT_RESULT_JSON, request_id), 200
             
             elif method == 'tools/list':
-                return self._mcp_response({
-                    'tools': [
-                        {
-                            'name': name,
-                            'description': getattr(tool, '__doc__', f'Tool: {name}')
-                        }
-                        for name, tool in self.tools.items()
-                    ]
-                }, request_id)
+                return _reply_json(_TOOLS_LIST_JSON, request_id), 200
             
             elif method == 'tools/call':
                 tool_name = params.get('name')
                 tool_params = params.get('arguments', {})
                 
-                if tool_name in self.tools:
+                if tool_name in _TOOL_NAME_SET:
                     # Track call count
-                    self.call_counts[tool_name] = self.call_counts.get(tool_name, 0) + 1
+                    self._call_counts[_TOOL_INDEX[tool_name]] += 1
                     
-                    # Execute tool
+                    # Execute tool, then warm the cache for the likely next call
                     result = await self._execute_tool(tool_name, tool_params)
-                    return self._mcp_response({
-                        'content': [{
-                            'type': 'text',
-                            'text': result
-                        }]
-                    }, request_id)
+                    self._prefetch_successor(tool_name)
+                    return _reply_json(_text_content_json(result), request_id), 200
                 else:
-                    return self._mcp_error(f'Unknown tool: {tool_name}', request_id)
+                    return self._mcp_error_message(f'Unknown tool: {tool_name}', request_id), 400
             
             else:
-                return self._mcp_error(f'Unknown method: {method}', request_id)
+                return self._mcp_error_message(f'Unknown method: {method}', request_id), 400
                 
         except Exception as e:
             console.error(f"MCP request error: {e}")
-            return self._mcp_error(str(e), body.get('id'))
+            return self._mcp_error_message(str(e), request_id), 400
+    
+    def _stream_tool(self, tool_name: str, params: Dict[str, Any], request_id: Optional[str] = None,
+                     progress_token: Optional[Any] = None):
+        """Run a streaming tool, sending each chunk as an NDJSON progress frame
+        
+        Progress notifications are only sent when the request carried a
+        progressToken in params._meta, and echo that token back. The last frame
+        is the same tools/call result the non-streaming path returns, including
+        on failure.
+        """
+        stream = TransformStream.new()
+        writer = stream.writable.getWriter()
+        encoder = TextEncoder.new()
+        self._call_counts[_TOOL_INDEX[tool_name]] += 1
+        
+        async def pump():
+            chunks = []
+            try:
+                async for chunk in getattr(self, tool_name)(**params):
+                    chunks.append(chunk)
+                    if progress_token is None:
+                        continue
+                    frame = dumps_json({
+                        'jsonrpc': '2.0',
+                        'method': 'notifications/progress',
+                        'params': {'progressToken': progress_token, 'progress': len(chunks), 'message': chunk}
+                    })
+                    await writer.write(encoder.encode(frame + '\n'))
+                text = ''.join(chunks)
+            except Exception as e:
+                console.error(f"Tool execution error for {tool_name}: {e}")
+                text = _tool_failure_json(e)
+            final = _reply_json(_text_content_json(text), request_id)
+            self._prefetch_successor(tool_name)
+            await writer.write(encoder.encode(final + '\n'))
+            await writer.close()
+        
+        self.ctx.waitUntil(asyncio.ensure_future(pump()))
+        return Response(stream.readable, {'status': 200, 'headers': _NDJSON_HEADERS})
+    
+    def _prefetch_successor(self, tool_name: str):
+        """Record the transition into a finished tool and warm the cache for its usual successor
+        
+        Only read-only tools whose results are cached are prefetched, only once
+        the transition has been seen PREFETCH_MIN_SUPPORT times, and never after
+        a tool that writes data, since the prefetched result could miss the write.
+        """
+        if self._last_tool is not None:
+            self._successors.setdefault(self._last_tool, Counter())[tool_name] += 1
+        self._last_tool = tool_name
+        
+        if tool_name in _WRITE_TOOLS:
+            return
+        successors = self._successors.get(tool_name)
+        if not successors:
+            return
+        successor, support = successors.most_common(1)[0]
+        if support >= PREFETCH_MIN_SUPPORT and successor in _PREFETCHABLE_TOOLS:
+            self.ctx.waitUntil(asyncio.ensure_future(self._execute_tool(successor, {})))
+    
+    def _call_count_snapshot(self) -> Dict[str, int]:
+        """Return the tools called so far with their counts"""
+        return {name: count for name, count in zip(_TOOL_NAMES, self._call_counts) if count}
     
     async def _execute_tool(self, tool_name: str, params: Dict[str, Any]) -> str:
         """Execute a registered tool"""
         try:
-            tool_func = self.tools[tool_name]
+            tool_func = getattr(self, tool_name)
             
             # Call the tool function with parameters
-            if hasattr(tool_func, '__code__') and tool_func.__code__.co_argcount > 1:
-                # Function takes parameters
-                result = await tool_func(**params)
-            else:
-                # Function takes no parameters
+            if tool_name in _ZERO_ARG_TOOLS:
                 result = await tool_func()
+            elif tool_name in _STREAMING_TOOLS:
+                # Without a streaming client, collect the chunks into one reply
+                result = ''.join([chunk async for chunk in tool_func(**params)])
+            else:
+                result = await tool_func(**params)
             
-            return result if isinstance(result, str) else json.dumps(result, indent=2)
+            return result if isinstance(result, str) else dumps_json(result, indent=True)
             
         except Exception as e:
             console.error(f"Tool execution error for {tool_name}: {e}")
-            return json.dumps({'error': f'Tool execution failed: {str(e)}'})
+            return _tool_failure_json(e)
     
     # ==================== MCP TOOL IMPLEMENTATIONS ====================
     
     async def health_check(self) -> str:
         """Check server health and database connectivity"""
         try:
-            # Test D1 database
-            await self.db_manager.test_connection()
-            
-            # Get basic stats
-            stats = await self.db_manager.get_database_stats()
+            # Test D1 and get basic stats in a single batch
+            stats = await self.db_manager.health_and_stats()
             
             health_info = {
-                "status": "healthy",
-                "database": "connected",
+                "status": "healthy" if stats['connected'] else "unhealthy",
+                "database": "connected" if stats['connected'] else "disconnected",
                 "active_sessions": 1,
-                "total_memories": stats.get('memories_count', 0),
-                "total_tasks": stats.get('tasks_count', 0),
-                "uptime_minutes": int((datetime.now() - self.start_time).total_seconds() / 60),
-                "call_counts": self.call_counts,
+                "total_memories": stats['memories_count'],
+                "total_tasks": stats['tasks_count'],
+                "uptime_minutes": int((time.monotonic() - self._mono_start) / 60),
+                "call_counts": self._call_count_snapshot(),
                 "timestamp": datetime.now().isoformat()
             }
             
-            return json.dumps(health_info, indent=2)
+            return dumps_json(health_info, indent=True)
         except Exception as e:
-            return json.dumps({
+            return dumps_json({
                 "status": "unhealthy",
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
@@ -250,12 +455,48 @@ class MemoryManagerMCP:
     async def get_memory_context(self, query: str = "") -> str:
         """Get current memory context and task reminders for the AI"""
         try:
-            context = await self.memory_manager.get_memory_context(query)
-            return context if context else "No context available"
+            # Agents repeat a few queries every turn, so serve recent contexts from KV
+            normalized = query.strip().lower()
+            key = _context_key(normalized)
+            cached = await self._get_cached_context(key)
+            if cached is not None:
+                return cached
+            
+            # The first call after initialize usually picks up the prefetched default context
+            if not normalized and self._ctx_prefetch is not None:
+                prefetch, self._ctx_prefetch = self._ctx_prefetch, None
+                context = await prefetch
+            else:
+                context = await self.memory_manager.get_memory_context(query)
+            if not context:
+                return "No context available"
+            if context.startswith(_CONTEXT_ERROR_PREFIX):
+                # Don't pin a transient failure in KV for the cache lifetime
+                return context
+            
+            self.ctx.waitUntil(self.kv.put(key, context, {'expirationTtl': CONTEXT_CACHE_TTL}))
+            return context
         except Exception as e:
             console.error(f"Error getting memory context: {e}")
             return f"Error retrieving context: {str(e)}"
     
+    async def _get_cached_context(self, key: str) -> Optional[str]:
+        """Read a cached context; a KV error counts as a miss"""
+        try:
+            return await self.kv.get(key)
+        except Exception as e:
+            console.error(f"Error reading context cache: {e}")
+            return None
+    
+    def _invalidate_context_cache(self) -> None:
+        """Drop cached contexts that a write has made stale
+        
+        Only the empty-query context has a known key; contexts for other
+        queries expire within CONTEXT_CACHE_TTL.
+        """
+        self._ctx_prefetch = None
+        self.ctx.waitUntil(self.kv.delete(_DEFAULT_CONTEXT_KEY))
+    
     async def create_task(self, title: str, description: str = "", priority: str = "medium", category: str = "feature") -> str:
         """Create a new task for the current project"""
         try:
@@ -265,6 +506,7 @@ class MemoryManagerMCP:
                 priority=priority,
                 category=category
             )
+            self._invalidate_context_cache()
             return f"✅ Task created: '{title}' (ID: {task_id[:8]}...)"
         except Exception as e:
             console.error(f"Error creating task: {e}")
@@ -273,105 +515,105 @@ class MemoryManagerMCP:
     # Add placeholder implementations for other tools
     async def get_tasks(self, status: str = None, limit: int = 20) -> str:
         """Get tasks for the current project"""
-        return json.dumps({"placeholder": "get_tasks implementation needed"})
+        return _PH_GET_TASKS
     
     async def update_task_status(self, task_id: str, status: str) -> str:
         """Update task status"""
-        return json.dumps({"placeholder": "update_task_status implementation needed"})
+        return _PH_UPDATE_TASK_STATUS
     
     async def get_project_summary(self) -> str:
         """Get comprehensive project overview"""
-        return json.dumps({"placeholder": "get_project_summary implementation needed"})
+        return _PH_GET_PROJECT_SUMMARY
     
-    async def start_thinking_chain(self, objective: str) -> str:
+    async def start_thinking_chain(self, objective: str) -> AsyncIterator[str]:
         """Begin structured reasoning process"""
-        return json.dumps({"placeholder": "start_thinking_chain implementation needed"})
+        yield _PH_START_THINKING_CHAIN
     
-    async def add_thinking_step(self, chain_id: str, stage: str, title: str, content: str, reasoning: str = "") -> str:
+    async def add_thinking_step(self, chain_id: str, stage: str, title: str, content: str, reasoning: str = "") -> AsyncIterator[str]:
         """Add reasoning steps"""
-        return json.dumps({"placeholder": "add_thinking_step implementation needed"})
+        yield _PH_ADD_THINKING_STEP
     
     async def get_thinking_chain(self, chain_id: str) -> str:
         """Retrieve complete thinking chain"""  
-        return json.dumps({"placeholder": "get_thinking_chain implementation needed"})
+        return _PH_GET_THINKING_CHAIN
     
     async def list_thinking_chains(self, limit: int = 10) -> str:
         """List recent thinking chains"""
-        return json.dumps({"placeholder": "list_thinking_chains implementation needed"})
+        return _PH_LIST_THINKING_CHAINS
     
     async def create_context_summary(self, content: str, key_points: str = "", decisions: str = "", actions: str = "") -> str:
         """Compress context for token optimization"""
-        return json.dumps({"placeholder": "create_context_summary implementation needed"})
+        return _PH_CREATE_CONTEXT_SUMMARY
     
     async def start_new_chat_session(self, title: str, objective: str = "", continue_from: str = "") -> str:
         """Begin new conversation with optional continuation"""
-        return json.dumps({"placeholder": "start_new_chat_session implementation needed"})
+        return _PH_START_NEW_CHAT_SESSION
     
     async def consolidate_current_session(self) -> str:
         """Compress current session for handoff"""
-        return json.dumps({"placeholder": "consolidate_current_session implementation needed"})
+        return _PH_CONSOLIDATE_CURRENT_SESSION
     
     async def get_optimized_context(self, max_tokens: int = 4000) -> str:
         """Get token-optimized context"""
-        return json.dumps({"placeholder": "get_optimized_context implementation needed"})
+        return _PH_GET_OPTIMIZED_CONTEXT
     
     async def estimate_token_usage(self, text: str) -> str:
         """Estimate token count for planning"""
-        return json.dumps({"placeholder": "estimate_token_usage implementation needed"})
+        return _PH_ESTIMATE_TOKEN_USAGE
     
-    async def auto_process_conversation(self, content: str, interaction_type: str = "conversation") -> str:
+    async def auto_process_conversation(self, content: str, interaction_type: str = "conversation") -> AsyncIterator[str]:
         """Extract memories and tasks automatically"""
-        return json.dumps({"placeholder": "auto_process_conversation implementation needed"})
+        yield _PH_AUTO_PROCESS_CONVERSATION
     
     async def decompose_task(self, prompt: str) -> str:
         """Break complex tasks into subtasks"""
-        return json.dumps({"placeholder": "decompose_task implementation needed"})
+        return _PH_DECOMPOSE_TASK
     
     async def auto_learn_project_conventions(self) -> str:
         """Automatically detect and learn project patterns"""
-        return json.dumps({"placeholder": "auto_learn_project_conventions implementation needed"})
+        return _PH_AUTO_LEARN_PROJECT_CONVENTIONS
     
     async def get_project_conventions(self) -> str:
         """Get formatted summary of learned conventions"""
-        return json.dumps({"placeholder": "get_project_conventions implementation needed"})
+        return _PH_GET_PROJECT_CONVENTIONS
     
     async def suggest_correct_command(self, user_command: str) -> str:
         """Suggest project-appropriate command corrections"""
-        return json.dumps({"placeholder": "suggest_correct_command implementation needed"})
+        return _PH_SUGGEST_CORRECT_COMMAND
     
     async def remember_project_pattern(self, pattern_type: str, pattern_name: str, pattern_content: str, importance: float = 0.8) -> str:
         """Manually store project patterns"""
-        return json.dumps({"placeholder": "remember_project_pattern implementation needed"})
+        return _PH_REMEMBER_PROJECT_PATTERN
     
     async def update_memory_context(self, query: str = "") -> str:
         """Refresh memory context with latest project conventions"""
-        return json.dumps({"placeholder": "update_memory_context implementation needed"})
+        return _PH_UPDATE_MEMORY_CONTEXT
     
     async def get_performance_stats(self) -> str:
         """Get server performance statistics"""
-        uptime_seconds = (datetime.now() - self.start_time).total_seconds()
+        uptime_seconds = time.monotonic() - self._mono_start
         stats = {
             "uptime_hours": round(uptime_seconds / 3600, 2),
-            "call_counts": self.call_counts,
-            "total_calls": sum(self.call_counts.values())
+            "call_counts": self._call_count_snapshot(),
+            "total_calls": sum(self._call_counts)
         }
-        return json.dumps(stats, indent=2)
+        return dumps_json(stats, indent=True)
     
     async def cleanup_old_data(self, days_old: int = 30) -> str:
         """Clean up old memories and tasks"""
-        return json.dumps({"placeholder": "cleanup_old_data implementation needed"})
+        return _PH_CLEANUP_OLD_DATA
     
     async def optimize_memories(self) -> str:
         """Remove duplicates and optimize storage"""
-        return json.dumps({"placeholder": "optimize_memories implementation needed"})
+        return _PH_OPTIMIZE_MEMORIES
     
     async def get_database_stats(self) -> str:
         """Get comprehensive database statistics"""
         try:
             stats = await self.db_manager.get_database_stats()
-            return json.dumps(stats, indent=2)
+            return dumps_json(stats, indent=True)
         except Exception as e:
-            return json.dumps({"error": f"Failed to get database stats: {str(e)}"})
+            return dumps_json({"error": f"Failed to get database stats: {str(e)}"})
     
     # ==================== UTILITY METHODS ====================
     
@@ -381,42 +623,17 @@ class MemoryManagerMCP:
     
     def _cors_response(self):
         """Return CORS preflight response"""
-        return Response(None, {
-            'status': 204,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-            }
-        })
+        return Response(None, {'status': 204, 'headers': _CORS_HEADERS})
     
     def _json_response(self, data: Dict[str, Any], status: int = 200):
         """Return JSON response with CORS headers"""
         return Response(
-            json.dumps(data),
-            {
-                'status': status,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-                }
-            }
+            dumps_json(data),
+            {'status': status, 'headers': _JSON_HEADERS}
         )
     
-    def _mcp_response(self, result: Any, request_id: Optional[str] = None):
-        """Format MCP protocol response"""
-        response = {
-            'jsonrpc': '2.0',
-            'result': result
-        }
-        if request_id is not None:
-            response['id'] = request_id
-        return self._json_response(response)
-    
-    def _mcp_error(self, message: str, request_id: Optional[str] = None):
-        """Format MCP protocol error response"""
+    def _mcp_error_message(self, message: str, request_id: Optional[str] = None) -> str:
+        """Serialize an MCP protocol error message"""
         response = {
             'jsonrpc': '2.0',
             'error': {
@@ -426,8 +643,40 @@ class MemoryManagerMCP:
         }
         if request_id is not None:
             response['id'] = request_id
-        return self._json_response(response, 400)
+        return dumps_json(response)
+    
+    def _mcp_error(self, message: str, request_id: Optional[str] = None):
+        """Format MCP protocol error response"""
+        return Response(self._mcp_error_message(message, request_id), {'status': 400, 'headers': _JSON_HEADERS})
+
 
+# Tools whose method takes no arguments besides self, resolved once at import
+_ZERO_ARG_TOOLS = frozenset(
+    name for name in _TOOL_NAMES
+    if len(inspect.signature(getattr(MemoryManagerMCP, name)).parameters) == 1
+)
+
+# Long-running tools implemented as async generators of text chunks
+_STREAMING_TOOLS = frozenset(
+    name for name in _TOOL_NAMES
+    if inspect.isasyncgenfunction(getattr(MemoryManagerMCP, name))
+)
+
+# The tool list never changes, so the tools/list result is serialized once at import
+_TOOLS_LIST_JSON = dumps_json({
+    'tools': [
+        {
+            'name': name,
+            'description': (getattr(MemoryManagerMCP, name).__doc__ or f'Tool: {name}').strip()
+        }
+        for name in _TOOL_NAMES
+    ]
+})
+
+_ROUTES = {
+    '/mcp': MemoryManagerMCP._handle_mcp_request,
+    '/health': MemoryManagerMCP._handle_health_check,
+}
 
 # Entry point for Cloudflare Workers
 async def on_fetch(request, env):
@@ -443,12 +692,9 @@ async def on_fetch(request, env):
     except Exception as e:
         console.error(f"Worker error: {e}")
         return Response(
-            json.dumps({'error': 'Internal server error'}),
+            dumps_json({'error': 'Internal server error'}),
             {
                 'status': 500,
                 'headers': {'Content-Type': 'application/json'}
             }
-        )
-
-# Export the handler
-fetch = create_proxy(on_fetch)
\ No newline at end of file
+        )
\ No newline at end of file
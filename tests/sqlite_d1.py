@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory SQLite stand-in for the D1 binding, with the D1 migrations applied
+
+Foreign keys are enforced as they are on D1, so tests exercise the real SQL
+in src/database_d1.py rather than a hand-written fake.
+"""
+import os
+import sqlite3
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+class Result:
+    def __init__(self, results):
+        self.results = results
+
+class Statement:
+    def __init__(self, db, sql, params=()):
+        self.db = db
+        self.sql = sql
+        self.params = params
+
+    def bind(self, *params):
+        return Statement(self.db, self.sql, params)
+
+    def _execute(self):
+        cursor = self.db.conn.execute(self.sql, self.params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    async def first(self):
+        rows = self._execute()
+        self.db.conn.commit()
+        return rows[0] if rows else None
+
+    async def all(self):
+        rows = self._execute()
+        self.db.conn.commit()
+        return Result(rows)
+
+    async def run(self):
+        return await self.all()
+
+class SQLiteD1:
+    """D1 binding backed by an in-memory SQLite database"""
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        for name in sorted(os.listdir(MIGRATIONS_DIR)):
+            if name.endswith(".sql"):
+                with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+                    self.conn.executescript(f.read())
+
+    def prepare(self, sql):
+        return Statement(self, sql)
+
+    async def batch(self, statements):
+        # D1 batches run as one transaction
+        try:
+            results = [Result(statement._execute()) for statement in statements]
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return results
+
+    def count(self, table):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
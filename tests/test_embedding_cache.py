@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script to verify the KV-backed EmbeddingCache against fake bindings
+"""
+import sys
+import os
+import asyncio
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embeddings_cf import CloudflareEmbeddings, EmbeddingCache
+
+class FakeKV:
+    def __init__(self):
+        self.values = {}
+        self.puts = []
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def put(self, key, value, options):
+        self.puts.append((key, options))
+        self.values[key] = value
+
+class FakeEmbeddings(CloudflareEmbeddings):
+    """Embeds each text as [len(text), 1.0] and records the batches it was asked for"""
+    def __init__(self):
+        super().__init__(None)
+        self.batches = []
+
+    async def generate_embedding(self, text):
+        self.batches.append([text])
+        return [float(len(text)), 1.0]
+
+    async def generate_embeddings(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+def test_miss_then_hit():
+    async def run():
+        kv, model = FakeKV(), FakeEmbeddings()
+        cache = EmbeddingCache(model, kv, ttl_seconds=120)
+
+        first = await cache.generate_embedding("hello")
+        assert first == [5.0, 1.0]
+        assert len(kv.puts) == 1 and kv.puts[0][1] == {'expirationTtl': 120}
+
+        second = await cache.generate_embedding("hello")
+        assert second == first
+        assert model.batches == [["hello"]]
+
+    asyncio.run(run())
+
+def test_batch_embeds_only_misses():
+    async def run():
+        kv, model = FakeKV(), FakeEmbeddings()
+        cache = EmbeddingCache(model, kv)
+        await cache.generate_embedding("cached")
+
+        results = await cache.generate_embeddings(["cached", "new one", "other"])
+        assert results == [[6.0, 1.0], [7.0, 1.0], [5.0, 1.0]]
+        assert model.batches == [["cached"], ["new one", "other"]]
+        assert len(kv.puts) == 3
+
+    asyncio.run(run())
+
+def test_key_ignores_case_and_whitespace():
+    async def run():
+        model = FakeEmbeddings()
+        cache = EmbeddingCache(model, FakeKV())
+        assert cache._cache_key("Hello   World") == cache._cache_key(" hello world\n")
+        assert cache._cache_key("hello world") != cache._cache_key("hello, world")
+        assert cache._cache_key("x").startswith(f"emb:{model.model_name}:")
+
+        await cache.generate_embedding("Hello   World")
+        await cache.generate_embedding("hello world")
+        assert model.batches == [["Hello   World"]]
+
+    asyncio.run(run())
+
+def test_writes_run_through_wait_until():
+    async def run():
+        kv, scheduled = FakeKV(), []
+        cache = EmbeddingCache(FakeEmbeddings(), kv, wait_until=scheduled.append)
+
+        await cache.generate_embeddings(["a", "b"])
+        assert len(scheduled) == 1
+        await scheduled[0]
+        assert len(kv.puts) == 2
+
+    asyncio.run(run())
+
+class SlowAI:
+    def __init__(self):
+        self.calls = 0
+
+    async def run(self, model, inputs):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {'data': [[2.0, 0.0]]}
+
+def test_cancelled_caller_keeps_shared_request():
+    async def run():
+        ai = SlowAI()
+        embeddings = CloudflareEmbeddings(ai)
+        first = asyncio.ensure_future(embeddings.generate_embedding("text"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(embeddings.generate_embedding("text"))
+        await asyncio.sleep(0)
+
+        # Cancelling the caller that started the request leaves it running for the other
+        first.cancel()
+        assert await second == [1.0, 0.0]
+        assert ai.calls == 1
+
+        # The finished request was still cached
+        assert await embeddings.generate_embedding("text") == [1.0, 0.0]
+        assert ai.calls == 1 and not embeddings._inflight
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_miss_then_hit()
+    test_batch_embeds_only_misses()
+    test_key_ignores_case_and_whitespace()
+    test_writes_run_through_wait_until()
+    test_cancelled_caller_keeps_shared_request()
+    print("=== Test Complete ===")
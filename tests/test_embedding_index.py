@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script to verify EmbeddingIndex similarity ranking
+"""
+import sys
+import os
+
+# Add Worker sources to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import embeddings_cf
+from embeddings_cf import CloudflareEmbeddings, EmbeddingIndex, encode_embedding, decode_embedding, quantize_embedding, dequantize_embedding
+
+def test_embedding_index_query():
+    index = EmbeddingIndex(capacity=2, quantize=False)
+    index.add({'id': 'a', 'embedding': [1.0, 0.0, 0.5]})
+    index.add({'id': 'b', 'embedding': [0.0, 1.0, 0.0]})
+    index.add({'id': 'c', 'embedding': [1.0, 0.1, 0.4]})
+    assert not index.add({'id': 'd', 'embedding': None})
+
+    # Storage grows past the initial capacity
+    assert len(index) == 3
+
+    results = index.query([2.0, 0.0, 1.0], threshold=0.7)
+    assert [r['id'] for r in results] == ['a', 'c']
+    assert abs(results[0]['similarity'] - 1.0) < 1e-5
+
+    top = index.query([2.0, 0.0, 1.0], threshold=-1.0, top_k=2)
+    assert [r['id'] for r in top] == ['a', 'c']
+
+def test_embedding_index_int8_matches_float32():
+    items = [
+        {'id': 'a', 'embedding': [0.3, -0.2, 0.9, 0.1]},
+        {'id': 'b', 'embedding': [-0.5, 0.4, 0.1, 0.7]},
+        {'id': 'c', 'embedding': [0.2, -0.1, 0.8, 0.3]},
+    ]
+    exact = EmbeddingIndex(quantize=False)
+    quantized = EmbeddingIndex()
+    for item in items:
+        exact.add(item)
+        quantized.add(item)
+
+    assert quantized.matrix.dtype.name == 'int8'
+
+    query = [0.3, -0.2, 0.9, 0.0]
+    exact_results = exact.query(query, threshold=-1.0)
+    quantized_results = quantized.query(query, threshold=-1.0)
+    assert [r['id'] for r in quantized_results] == [r['id'] for r in exact_results]
+    for e, q in zip(exact_results, quantized_results):
+        assert abs(e['similarity'] - q['similarity']) < 0.02
+
+def test_embedding_index_empty_and_zero_query():
+    index = EmbeddingIndex()
+    assert index.query([1.0, 0.0]) == []
+
+    index.add({'id': 'a', 'embedding': [1.0, 0.0]})
+    assert index.query([0.0, 0.0]) == []
+
+def test_embedding_binary_round_trip():
+    embedding = [0.25, -0.5, 0.125, 1.0]
+    blob = encode_embedding(embedding)
+    assert len(blob) == 4 * len(embedding)
+    assert decode_embedding(blob) == embedding
+
+    # Pure-Python fallback produces the same bytes
+    numpy_available = embeddings_cf.NUMPY_AVAILABLE
+    embeddings_cf.NUMPY_AVAILABLE = False
+    try:
+        assert encode_embedding(embedding) == blob
+        assert decode_embedding(blob) == embedding
+    finally:
+        embeddings_cf.NUMPY_AVAILABLE = numpy_available
+
+def test_embedding_int8_storage():
+    embedding = [0.3, -0.2, 0.9, 0.1]
+    blob, scale = quantize_embedding(embedding)
+    assert len(blob) == len(embedding)
+    assert abs(scale - 127 / 0.9) < 1e-4
+    for original, restored in zip(embedding, dequantize_embedding(blob, scale)):
+        assert abs(original - restored) < 0.01
+
+    # Stored int8 rows rank the same as their float source
+    items = [
+        {'id': 'a', 'embedding': [0.3, -0.2, 0.9, 0.1]},
+        {'id': 'b', 'embedding': [-0.5, 0.4, 0.1, 0.7]},
+    ]
+    stored = [{'id': item['id'], 'embedding_q8': blob, 'embedding_scale': scale}
+              for item, (blob, scale) in zip(items, map(quantize_embedding, (i['embedding'] for i in items)))]
+    exact = EmbeddingIndex(quantize=False)
+    quantized = EmbeddingIndex()
+    for item, row in zip(items, stored):
+        exact.add(item)
+        quantized.add(row)
+    query = [0.3, -0.2, 0.9, 0.0]
+    exact_results = exact.query(query, threshold=-1.0)
+    quantized_results = quantized.query(query, threshold=-1.0)
+    assert [r['id'] for r in quantized_results] == [r['id'] for r in exact_results]
+    for e, q in zip(exact_results, quantized_results):
+        assert abs(e['similarity'] - q['similarity']) < 0.02
+
+def test_embedding_index_pack_round_trip():
+    index = EmbeddingIndex(capacity=1)
+    index.add({'id': 'a', 'embedding': [0.3, -0.2, 0.9, 0.1]})
+    index.add({'id': 'b', 'embedding': [-0.5, 0.4, 0.1, 0.7]})
+
+    restored = EmbeddingIndex.from_bytes(index.to_bytes())
+    assert len(restored) == 2
+    query = [0.3, -0.2, 0.9, 0.0]
+    assert restored.query(query, threshold=-1.0) == [
+        {'id': r['id'], 'similarity': r['similarity']} for r in index.query(query, threshold=-1.0)
+    ]
+
+    # Restored indexes keep accepting new rows
+    restored.add({'id': 'c', 'embedding': [0.2, -0.1, 0.8, 0.3]})
+    assert len(restored) == 3
+
+    empty = EmbeddingIndex.from_bytes(EmbeddingIndex().to_bytes())
+    assert len(empty) == 0 and empty.query(query) == []
+
+def test_int8_fallbacks_without_simsimd():
+    index = EmbeddingIndex()
+    for i, embedding in enumerate([[0.3, -0.2, 0.9, 0.1], [-0.5, 0.4, 0.1, 0.7], [0.2, -0.1, 0.8, 0.3]]):
+        index.add({'id': i, 'embedding': embedding})
+    query = [0.3, -0.2, 0.9, 0.0]
+
+    simsimd_available = embeddings_cf.SIMSIMD_AVAILABLE
+    numba_available = embeddings_cf.NUMBA_AVAILABLE
+    embeddings_cf.SIMSIMD_AVAILABLE = False
+    try:
+        # numba is imported lazily, only once a query needs the compiled kernel
+        compiled = index.query(query, threshold=-1.0)
+        embeddings_cf.NUMBA_AVAILABLE = False
+        widened = index.query(query, threshold=-1.0)
+    finally:
+        embeddings_cf.SIMSIMD_AVAILABLE = simsimd_available
+        embeddings_cf.NUMBA_AVAILABLE = numba_available
+
+    assert [r['id'] for r in compiled] == [r['id'] for r in widened]
+    for c, w in zip(compiled, widened):
+        # The compiled kernel also quantizes the query
+        assert abs(c['similarity'] - w['similarity']) < 0.01
+
+def test_rank_without_numpy_matches_index():
+    items = [
+        {'id': 'a', 'embedding': [3.0, 0.0, 1.5]},
+        {'id': 'b', 'embedding': [0.0, 2.0, 0.0]},
+    ]
+    q8, scale = quantize_embedding([1.0, 0.1, 0.4])
+    items.append({'id': 'c', 'embedding_q8': q8, 'embedding_scale': scale})
+    query = [2.0, 0.0, 1.0]
+    expected = EmbeddingIndex(quantize=False)
+    for item in items:
+        expected.add(item)
+
+    numpy_available = embeddings_cf.NUMPY_AVAILABLE
+    embeddings_cf.NUMPY_AVAILABLE = False
+    try:
+        ranked = CloudflareEmbeddings(None).rank_by_similarity(query, items, threshold=-1.0)
+    finally:
+        embeddings_cf.NUMPY_AVAILABLE = numpy_available
+
+    # Unnormalized rows score as cosines, not raw dot products
+    assert [r['id'] for r in ranked] == [r['id'] for r in expected.query(query, threshold=-1.0)]
+    assert abs(ranked[0]['similarity'] - 1.0) < 1e-5
+    assert all(r['similarity'] <= 1.0 + 1e-5 for r in ranked)
+
+if __name__ == "__main__":
+    test_embedding_index_query()
+    test_embedding_index_int8_matches_float32()
+    test_embedding_index_empty_and_zero_query()
+    test_embedding_binary_round_trip()
+    test_embedding_int8_storage()
+    test_embedding_index_pack_round_trip()
+    test_int8_fallbacks_without_simsimd()
+    test_rank_without_numpy_matches_index()
+    print("=== Test Complete ===")
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script to verify CloudflareMemoryManager against fake bindings
+"""
+import sys
+import os
+import asyncio
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database_d1 import D1DatabaseManager
+from src.memory_manager_cf import CloudflareMemoryManager
+from src.embeddings_cf import CloudflareEmbeddings, dequantize_embedding, quantize_embedding
+from tests.sqlite_d1 import SQLiteD1
+
+class FakeR2:
+    """In-memory R2 bucket whose puts land after a short delay"""
+    def __init__(self):
+        self.objects = {}
+
+    async def get(self, key):
+        if key not in self.objects:
+            return None
+        blob = self.objects[key]
+
+        class Body:
+            async def arrayBuffer(self):
+                class Buffer:
+                    def to_bytes(self):
+                        return blob
+                return Buffer()
+        return Body()
+
+    async def put(self, key, value):
+        await asyncio.sleep(0.02)
+        self.objects[key] = value
+
+    async def delete(self, key):
+        self.objects.pop(key, None)
+
+class FakeDB:
+    """Memories table snapshotted at the start of each read"""
+    def __init__(self, rows=None, tasks=None):
+        self.rows = rows or []
+        self.tasks = tasks or []
+        self.patched = []
+
+    async def get_memories(self, project_id, memory_ids=None, limit=None):
+        snapshot = list(self.rows)
+        await asyncio.sleep(0.01)
+        return [row for row in snapshot if memory_ids is None or row['id'] in memory_ids]
+
+    async def get_tasks(self, project_id, status=None, limit=None):
+        return self.tasks[:limit]
+
+    async def add_memories(self, rows):
+        return [f'new{i}' for i in range(len(rows))]
+
+    async def update_embeddings(self, memory_ids, embeddings):
+        patched = [memory_id for memory_id, embedding in zip(memory_ids, embeddings) if embedding]
+        self.patched.extend(patched)
+        return len(patched)
+
+class FakeEmbeddings(CloudflareEmbeddings):
+    def __init__(self):
+        super().__init__(None)
+
+    async def generate_embedding(self, text):
+        return [1.0, 0.0, 0.0]
+
+    async def generate_embeddings(self, texts):
+        return [None if not text else [0.6, 0.8, 0.0] for text in texts]
+
+class FakeKV:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def put(self, key, value, options=None):
+        self.values[key] = value
+
+def _row(memory_id, embedding):
+    q8, scale = quantize_embedding(embedding)
+    return {'id': memory_id, 'content': memory_id, 'embedding_q8': q8, 'embedding_scale': scale}
+
+def test_index_not_persisted_over_newer_embeddings():
+    async def run():
+        db = FakeDB([_row('m0', [1.0, 0.0, 0.0])])
+        r2 = FakeR2()
+        manager = CloudflareMemoryManager(db, FakeEmbeddings(), None, r2_bucket=r2)
+        manager.current_project_id = 'p'
+
+        async def concurrent_write():
+            await asyncio.sleep(0.005)
+            db.rows.append(_row('m1', [0.9, 0.1, 0.0]))
+            await manager._invalidate_index('p')
+
+        # The search read D1 before the write, so its index must be dropped
+        await asyncio.gather(manager._search_memories('q', 5), concurrent_write())
+        await asyncio.sleep(0.05)
+        assert r2.objects == {} and manager._indexes == {}
+
+        results = await manager._search_memories('q', 5)
+        assert [r['id'] for r in results] == ['m0', 'm1']
+        await asyncio.sleep(0.05)
+        assert list(r2.objects) == ['embeddings/p.idx']
+
+        # Invalidation waits for the pending put, then deletes
+        await manager._invalidate_index('p')
+        assert r2.objects == {}
+
+    asyncio.run(run())
+
+class FlakyEmbeddings:
+    """Fails the first batch outright, then cannot embed texts containing 'bad'"""
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_embeddings(self, texts):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("Workers AI unavailable")
+        return [None if 'bad' in text else [1.0, 0.0] for text in texts]
+
+def test_failed_embeddings_are_requeued():
+    async def run():
+        db = FakeDB()
+        manager = CloudflareMemoryManager(db, FlakyEmbeddings(), None)
+        manager._embed_queue = [('m0', 'good', 'p'), ('m1', 'bad', 'p')]
+
+        # An exception puts the whole drained batch back
+        await manager._embed_and_patch()
+        assert manager._embed_queue == [('m0', 'good', 'p'), ('m1', 'bad', 'p')]
+
+        # Rows that came back without an embedding stay queued
+        await manager._embed_and_patch()
+        assert db.patched == ['m0']
+        assert manager._embed_queue == [('m1', 'bad', 'p')]
+        assert not manager._embed_scheduled
+
+    asyncio.run(run())
+
+def test_memory_context_format():
+    async def run():
+        long_content = "x" * 250
+        db = FakeDB(
+            rows=[
+                {'id': 'm0', 'type': 'decision', 'title': 'Use D1', 'content': long_content},
+                {'id': 'm1', 'type': 'note', 'title': 'Short', 'content': 'brief'},
+            ],
+            tasks=[{'priority': 'high', 'title': 'Ship it'}]
+        )
+        manager = CloudflareMemoryManager(db, None, None)
+        manager.current_project_id = 'project-0123456789'
+
+        context = await manager.get_memory_context("storage")
+        assert "\\n" not in context
+        assert context.split("\n\n")[:2] == ["## Current Project: project-...", "Description: Auto-detected project"]
+        assert f"### Decision: Use D1\n\n{'x' * 200}...\n\n" in context
+        assert "### Note: Short\n\nbrief\n\n" in context
+        assert "## Pending Tasks:\n\n- [high] Ship it" in context
+
+    asyncio.run(run())
+
+def test_bulk_add_with_migrations():
+    async def run():
+        d1 = SQLiteD1()
+        db = D1DatabaseManager(d1)
+        manager = CloudflareMemoryManager(db, FakeEmbeddings(), FakeKV())
+
+        memory_ids = await manager.add_memories_bulk([
+            {'memory_type': 'note', 'title': 'first', 'content': 'has text', 'tags': ['a']},
+            {'memory_type': 'note', 'title': 'second', 'content': '', 'importance_score': 0.9},
+        ])
+        assert len(memory_ids) == 2 and len(set(memory_ids)) == 2
+        assert d1.count('projects') == 1
+
+        rows = await db.get_memories(project_id=manager.current_project_id, memory_ids=memory_ids)
+        by_title = {row['title']: row for row in rows}
+        assert [row['title'] for row in rows] == ['second', 'first']
+        first, second = by_title['first'], by_title['second']
+        assert first['embedding_normalized'] == 1 and first['tags'] == '["a"]'
+        restored = dequantize_embedding(first['embedding_q8'], first['embedding_scale'])
+        assert all(abs(a - b) < 0.01 for a, b in zip(restored, [0.6, 0.8, 0.0]))
+        assert second['embedding_q8'] is None and second['embedding_normalized'] == 0
+
+        # A second session on the same day reuses the project row
+        await CloudflareMemoryManager(db, FakeEmbeddings(), FakeKV()).start_session()
+        assert d1.count('projects') == 1
+
+    asyncio.run(run())
+
+def test_add_memory_persists_with_migrations():
+    async def run():
+        d1 = SQLiteD1()
+        db = D1DatabaseManager(d1)
+        background = []
+        write_behind = CloudflareMemoryManager(db, FakeEmbeddings(), FakeKV(), wait_until=background.append)
+        inline = CloudflareMemoryManager(db, FakeEmbeddings(), FakeKV())
+
+        # Memories added in the same second still get their own rows
+        queued = [await write_behind.add_memory('note', f'queued {i}', 'text') for i in range(2)]
+        stored = await inline.add_memory('note', 'inline', 'text', tags=['t'])
+        assert len({*queued, stored}) == 3
+        assert d1.count('memories') == 3
+
+        await asyncio.gather(*background)
+        rows = await db.get_memories(memory_ids=queued + [stored])
+        assert len(rows) == 3
+        assert all(row['embedding_q8'] is not None and row['embedding_normalized'] == 1 for row in rows)
+
+    asyncio.run(run())
+
+class FakeVectorize:
+    def __init__(self):
+        self.upserts = []
+
+    async def upsert(self, vectors):
+        self.upserts.append(vectors)
+
+    async def query(self, vector, options):
+        class Match:
+            def __init__(self, memory_id):
+                self.id = memory_id
+
+        class Result:
+            matches = [Match('m1'), Match('m0')]
+        return Result()
+
+def test_vectorize_upserts_and_ranking():
+    async def run():
+        db = FakeDB([_row('m0', [1.0, 0.0, 0.0]), _row('m1', [0.0, 1.0, 0.0])])
+        vectorize = FakeVectorize()
+        manager = CloudflareMemoryManager(db, FakeEmbeddings(), FakeKV(), vector_index=vectorize)
+        manager.current_project_id = 'p'
+
+        await manager.add_memories_bulk([
+            {'memory_type': 'note', 'title': 'a', 'content': 'text'},
+            {'memory_type': 'note', 'title': 'b', 'content': ''},
+        ])
+        assert vectorize.upserts == [[{'id': 'new0', 'values': [0.6, 0.8, 0.0], 'metadata': {'project_id': 'p'}}]]
+
+        # Hydrated rows keep the ANN order, not the D1 order
+        results = await manager._search_memories('q', 5)
+        assert [row['id'] for row in results] == ['m1', 'm0']
+
+    asyncio.run(run())
+
+def test_cancelled_search_keeps_shared_search():
+    async def run():
+        db = FakeDB([_row('m0', [1.0, 0.0, 0.0])])
+        manager = CloudflareMemoryManager(db, FakeEmbeddings(), None)
+        manager.current_project_id = 'p'
+        first = asyncio.ensure_future(manager._search_memories('q', 5))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(manager._search_memories('q', 5))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        assert [row['id'] for row in await second] == ['m0']
+        await asyncio.sleep(0)
+        assert manager._inflight_searches == {}
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_index_not_persisted_over_newer_embeddings()
+    test_failed_embeddings_are_requeued()
+    test_memory_context_format()
+    test_bulk_add_with_migrations()
+    test_add_memory_persists_with_migrations()
+    test_vectorize_upserts_and_ranking()
+    test_cancelled_search_keeps_shared_search()
+    print("=== Test Complete ===")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script to verify the Cloudflare sequential thinking engine against fake bindings
+"""
+import sys
+import os
+import asyncio
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database_d1 import D1DatabaseManager
+from src.sequential_thinking_cf import TRUNCATION_MARKER, CloudflareSequentialThinking
+from tests.sqlite_d1 import SQLiteD1
+
+class FakeDB:
+    """chain_steps table with steps already stored by an earlier instance"""
+    def __init__(self, stored_steps=0, fail_writes=False):
+        self.stored_steps = stored_steps
+        self.fail_writes = fail_writes
+        self.written = []
+
+    async def get_next_step_idx(self, chain_id):
+        return self.stored_steps
+
+    async def add_chain_steps(self, steps):
+        if self.fail_writes:
+            raise RuntimeError("D1 unavailable")
+        self.written.append(steps)
+        return len(steps['id'])
+
+class FakeEmbeddings:
+    async def generate_embeddings(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+class FakeMemoryManager:
+    current_project_id = None
+
+    async def add_memory(self, **kwargs):
+        return 'memory'
+
+def test_step_index_continues_stored_chain():
+    async def run():
+        db = FakeDB(stored_steps=3)
+        engine = CloudflareSequentialThinking(db, None, FakeEmbeddings())
+        first = await engine.add_thinking_step('chain', 'analysis', 't', 'c')
+        second = await engine.add_thinking_step('chain', 'planning', 't', 'c')
+        assert (first['step_index'], second['step_index']) == (3, 4)
+        assert [steps['step_idx'] for steps in db.written] == [[3], [4]]
+
+    asyncio.run(run())
+
+def test_failed_flush_keeps_steps():
+    async def run():
+        db = FakeDB(fail_writes=True)
+        engine = CloudflareSequentialThinking(db, None, FakeEmbeddings(), buffer_steps=True)
+        await engine.add_thinking_step('chain', 'analysis', 't', 'c')
+        try:
+            await engine.flush_thinking_steps()
+            assert False, "flush should raise"
+        except RuntimeError:
+            pass
+        assert len(engine._step_buffer) == 1
+
+        db.fail_writes = False
+        assert len(await engine.flush_thinking_steps()) == 1
+        assert len(engine._step_buffer) == 0
+
+    asyncio.run(run())
+
+def test_failed_unbuffered_step_is_discarded():
+    async def run():
+        db = FakeDB(fail_writes=True)
+        engine = CloudflareSequentialThinking(db, None, FakeEmbeddings())
+        failed = await engine.add_thinking_step('chain', 'analysis', 'first', 'c')
+        assert 'error' in failed
+        assert len(engine._step_buffer) == 0
+
+        # The next step is written alone and reuses the index the failed one took
+        db.fail_writes = False
+        step = await engine.add_thinking_step('chain', 'analysis', 'second', 'c')
+        assert step['step_index'] == 0
+        assert [steps['title'] for steps in db.written] == [['second']]
+
+    asyncio.run(run())
+
+def test_steps_persist_with_migrations():
+    async def run():
+        d1 = SQLiteD1()
+        engine = CloudflareSequentialThinking(D1DatabaseManager(d1), FakeMemoryManager(), FakeEmbeddings())
+        chain = await engine.start_thinking_chain('objective')
+        chain_id = chain['chain_id']
+        for stage in ('analysis', 'planning'):
+            step = await engine.add_thinking_step(chain_id, stage, stage, 'c')
+            assert 'error' not in step, step
+
+        stored = await engine.get_thinking_chain(chain_id)
+        assert stored['stages'] == ['analysis', 'planning']
+        assert d1.count('thinking_chains') == 1
+
+        # A new instance continues after the stored steps
+        resumed = CloudflareSequentialThinking(D1DatabaseManager(d1), FakeMemoryManager(), FakeEmbeddings())
+        step = await resumed.add_thinking_step(chain_id, 'execution', 'execution', 'c')
+        assert step['step_index'] == 2
+
+    asyncio.run(run())
+
+def test_unknown_stage_is_accepted():
+    async def run():
+        engine = CloudflareSequentialThinking(FakeDB(), None, FakeEmbeddings())
+        step = await engine.add_thinking_step('chain', 'brainstorm', 't', 'c')
+        assert step['stage'] == 'brainstorm'
+        assert step['next_stage'] == 'analysis'
+
+    asyncio.run(run())
+
+def test_compress_context_fits_budget():
+    async def run():
+        engine = CloudflareSequentialThinking(FakeDB(), None, FakeEmbeddings())
+        content = "word " * 200
+        for target in (5, 12, 40):
+            result = await engine.compress_context(content, target)
+            assert result['compressed_tokens'] <= target, (target, result['compressed_tokens'])
+            assert result['compressed_content'].endswith(TRUNCATION_MARKER)
+
+        short = await engine.compress_context("Short text.", 100)
+        assert short['compressed_content'] == "Short text."
+        assert short['compression_ratio'] == 1.0
+
+    asyncio.run(run())
+
+def test_compress_context_cuts_at_sentence():
+    async def run():
+        engine = CloudflareSequentialThinking(FakeDB(), None, FakeEmbeddings())
+        content = "First sentence here. Second sentence follows. " + "Third one is much longer " * 20
+        result = await engine.compress_context(content, 20)
+        assert result['compressed_content'] == "First sentence here. Second sentence follows." + TRUNCATION_MARKER
+        assert result['compressed_tokens'] <= 20
+
+    asyncio.run(run())
+
+def test_compress_context_without_sentence_falls_back_to_prefix():
+    async def run():
+        engine = CloudflareSequentialThinking(FakeDB(), None, FakeEmbeddings())
+        content = "x" * 400
+        result = await engine.compress_context(content, 20)
+        cut = result['compressed_content'][:-len(TRUNCATION_MARKER)]
+        assert cut and content.startswith(cut)
+        assert result['compressed_tokens'] <= 20
+
+    asyncio.run(run())
+
+def test_compress_context_non_positive_target():
+    async def run():
+        engine = CloudflareSequentialThinking(FakeDB(), None, FakeEmbeddings())
+        for target in (0, -5):
+            result = await engine.compress_context("Some content. More content.", target)
+            assert result['compressed_content'] == TRUNCATION_MARKER
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_step_index_continues_stored_chain()
+    test_failed_flush_keeps_steps()
+    test_failed_unbuffered_step_is_discarded()
+    test_steps_persist_with_migrations()
+    test_unknown_stage_is_accepted()
+    test_compress_context_fits_budget()
+    test_compress_context_cuts_at_sentence()
+    test_compress_context_without_sentence_falls_back_to_prefix()
+    test_compress_context_non_positive_target()
+    print("=== Test Complete ===")
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script to verify the MCP Durable Object against a stubbed js module and fake bindings
+"""
+import sys
+import os
+import asyncio
+import json
+import types
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class Response:
+    """Stand-in for the runtime Response constructor"""
+    def __init__(self, body, init):
+        self.body = body
+        self.status = init['status']
+        self.headers = init['headers']
+
+class Console:
+    def error(self, message):
+        pass
+
+class TextEncoder:
+    @staticmethod
+    def new():
+        return TextEncoder()
+
+    def encode(self, text):
+        return text.encode('utf-8')
+
+class TransformStream:
+    """Collects written chunks in readable, a plain list"""
+    @staticmethod
+    def new():
+        return TransformStream()
+
+    def __init__(self):
+        self.readable = []
+        self.writable = self
+
+    def getWriter(self):
+        return self
+
+    async def write(self, chunk):
+        self.readable.append(chunk)
+
+    async def close(self):
+        pass
+
+js = sys.modules.setdefault('js', types.ModuleType('js'))
+js.Response = Response
+js.TextEncoder = TextEncoder
+js.TransformStream = TransformStream
+js.console = Console()
+
+from src.worker import MemoryManagerMCP
+from tests.sqlite_d1 import SQLiteD1
+
+class FakeKV:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def put(self, key, value, options=None):
+        self.values[key] = value
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+class FakeCtx:
+    state = None
+
+    def __init__(self):
+        self.background = []
+
+    def waitUntil(self, awaitable):
+        self.background.append(asyncio.ensure_future(awaitable))
+
+class FakeEnv:
+    def __init__(self):
+        self.DB = SQLiteD1()
+        self.KV_CACHE = FakeKV()
+        self.AI = None
+        self.R2_STORAGE = None
+
+class FakeMemoryManager:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_memory_context(self, query=""):
+        self.calls += 1
+        return f"context {self.calls}"
+
+class FakeRequest:
+    def __init__(self, body=None, method='POST', headers=None):
+        self.method = method
+        self.url = "https://worker.example/mcp"
+        self.headers = headers or {}
+        self._body = body
+
+    async def json(self):
+        return self._body
+
+def _server():
+    server = MemoryManagerMCP(FakeCtx(), FakeEnv())
+    server.memory_manager = FakeMemoryManager()
+    return server
+
+def _post(server, body, **kwargs):
+    async def run():
+        response = await server.fetch(FakeRequest(body, **kwargs))
+        background, server.ctx.background = server.ctx.background, []
+        await asyncio.gather(*background)
+        return response
+    return asyncio.run(run())
+
+def test_mixed_batch_answers_only_requests():
+    response = _post(_server(), [
+        {'jsonrpc': '2.0', 'method': 'tools/list', 'id': 1},
+        {'jsonrpc': '2.0', 'method': 'notifications/initialized'},
+        {'jsonrpc': '2.0', 'method': 'tools/list', 'id': 'two'},
+    ])
+    assert response.status == 200
+    replies = json.loads(response.body)
+    assert [reply['id'] for reply in replies] == [1, 'two']
+    assert all('tools' in reply['result'] for reply in replies)
+
+def test_notification_only_batch_has_no_body():
+    response = _post(_server(), [
+        {'jsonrpc': '2.0', 'method': 'notifications/initialized'},
+        {'jsonrpc': '2.0', 'method': 'notifications/cancelled', 'params': {}},
+    ])
+    assert response.status == 202 and response.body is None
+
+def test_single_notification_has_no_body():
+    response = _post(_server(), {'jsonrpc': '2.0', 'method': 'notifications/initialized'})
+    assert response.status == 202 and response.body is None
+
+def test_malformed_messages_get_errors():
+    # A non-object batch element and a method-less object are answered, not ignored
+    response = _post(_server(), [5, {'jsonrpc': '2.0', 'id': 3}, {'jsonrpc': '2.0', 'method': 'tools/list', 'id': 4}])
+    replies = json.loads(response.body)
+    assert len(replies) == 3
+    assert 'error' in replies[0] and 'id' not in replies[0]
+    assert 'error' in replies[1] and replies[1]['id'] == 3
+    assert replies[2]['id'] == 4 and 'result' in replies[2]
+
+    # GET carries no JSON-RPC body at all
+    response = _post(_server(), None, method='GET')
+    assert response.status == 400 and 'error' in json.loads(response.body)
+
+def _call_context(server, query=""):
+    response = _post(server, {
+        'jsonrpc': '2.0', 'method': 'tools/call', 'id': 1,
+        'params': {'name': 'get_memory_context', 'arguments': {'query': query}}
+    })
+    return json.loads(response.body)['result']['content'][0]['text']
+
+def test_context_is_cached_and_invalidated():
+    server = _server()
+    assert _call_context(server) == "context 1"
+    assert _call_context(server) == "context 1"
+
+    server.memory_manager.create_task = lambda **kwargs: asyncio.sleep(0, 'task-id-123')
+    _post(server, {
+        'jsonrpc': '2.0', 'method': 'tools/call', 'id': 2,
+        'params': {'name': 'create_task', 'arguments': {'title': 't'}}
+    })
+    assert _call_context(server) == "context 2"
+
+def test_context_survives_kv_errors():
+    class BrokenKV(FakeKV):
+        async def get(self, key):
+            raise RuntimeError("KV unavailable")
+
+    server = _server()
+    server.kv = BrokenKV()
+    assert _call_context(server, "query") == "context 1"
+
+def test_context_errors_are_not_cached():
+    server = _server()
+    server.memory_manager.get_memory_context = lambda query="": asyncio.sleep(0, "Error retrieving context: D1 down")
+    assert _call_context(server).startswith("Error retrieving context")
+    assert server.kv.values == {}
+
+def _stream(server, meta=None):
+    params = {'name': 'start_thinking_chain', 'arguments': {'objective': 'o'}}
+    if meta is not None:
+        params['_meta'] = meta
+    response = _post(server, {'jsonrpc': '2.0', 'method': 'tools/call', 'id': 7, 'params': params},
+                     headers={'Accept': 'application/x-ndjson'})
+    return [json.loads(frame) for frame in b''.join(response.body).decode('utf-8').splitlines()]
+
+def test_stream_progress_echoes_token():
+    async def chunks(objective):
+        yield "a"
+        yield "b"
+
+    server = _server()
+    server.start_thinking_chain = chunks
+    frames = _stream(server, {'progressToken': 'tok'})
+    assert [frame['params'] for frame in frames[:-1]] == [
+        {'progressToken': 'tok', 'progress': 1, 'message': 'a'},
+        {'progressToken': 'tok', 'progress': 2, 'message': 'b'},
+    ]
+    assert frames[-1]['id'] == 7 and frames[-1]['result']['content'][0]['text'] == "ab"
+
+    # Without a token only the final result is sent
+    frames = _stream(server)
+    assert len(frames) == 1 and frames[0]['result']['content'][0]['text'] == "ab"
+
+def test_stream_failure_matches_plain_call():
+    async def failing(objective):
+        yield "a"
+        raise RuntimeError("boom")
+
+    server = _server()
+    server.start_thinking_chain = failing
+    streamed = _stream(server, {'progressToken': 1})[-1]
+    plain = json.loads(_post(server, {
+        'jsonrpc': '2.0', 'method': 'tools/call', 'id': 7,
+        'params': {'name': 'start_thinking_chain', 'arguments': {'objective': 'o'}}
+    }).body)
+    assert streamed == plain
+    assert json.loads(plain['result']['content'][0]['text']) == {'error': 'Tool execution failed: boom'}
+
+if __name__ == "__main__":
+    test_mixed_batch_answers_only_requests()
+    test_notification_only_batch_has_no_body()
+    test_single_notification_has_no_body()
+    test_malformed_messages_get_errors()
+    test_context_is_cached_and_invalidated()
+    test_context_survives_kv_errors()
+    test_context_errors_are_not_cached()
+    test_stream_progress_echoes_token()
+    test_stream_failure_matches_plain_call()
+    print("=== Test Complete ===")
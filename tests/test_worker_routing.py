@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script to verify request routing in the test Worker
+"""
+import sys
+import os
+import asyncio
+import json
+import types
+
+# The test Worker is deployed as a main module and imports its siblings top-level
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+class Response:
+    """Stand-in for the runtime Response constructor"""
+    def __init__(self, body, init):
+        self.body = body
+        self.status = init['status']
+        self.headers = init['headers']
+
+sys.modules.setdefault('js', types.ModuleType('js')).Response = Response
+
+import test_worker
+
+class FakeRequest:
+    def __init__(self, url):
+        self.url = url
+
+class FakeEnv:
+    DB = None
+    KV_CACHE = None
+    R2_STORAGE = None
+    AI = None
+
+def _fetch(url):
+    return asyncio.run(test_worker.on_fetch(FakeRequest(url), FakeEnv()))
+
+def test_routes_match_exact_path():
+    health = _fetch("https://worker.example/health")
+    assert health.status == 200 and health.headers['Content-Type'] == 'application/json'
+    assert json.loads(health.body)['status'] == 'healthy'
+
+    # Query strings are not part of the path
+    assert json.loads(_fetch("https://worker.example/health?verbose=1").body)['status'] == 'healthy'
+
+def test_substring_paths_use_default():
+    for url in (
+        "https://worker.example/foo/health/bar",
+        "https://worker.example/?next=/health",
+        "https://worker.example/test-kv-extra",
+        "https://worker.example/",
+    ):
+        body = json.loads(_fetch(url).body)
+        assert body['message'] == 'Enhanced MCP Memory Worker (Python)', url
+
+def test_binding_errors_return_500():
+    class BrokenKV:
+        async def put(self, key, value):
+            raise RuntimeError("KV unavailable")
+
+    env = FakeEnv()
+    env.KV_CACHE = BrokenKV()
+    response = asyncio.run(test_worker.on_fetch(FakeRequest("https://worker.example/test-kv"), env))
+    assert response.status == 500
+    assert json.loads(response.body) == {'success': False, 'error': 'KV unavailable'}
+
+if __name__ == "__main__":
+    test_routes_match_exact_path()
+    test_substring_paths_use_default()
+    test_binding_errors_return_500()
+    print("=== Test Complete ===")